@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+
+from functools import partial
+from os import environ, makedirs, remove, utime, walk
+from os.path import dirname, join, realpath, relpath, sep
+from random import Random
+from subprocess import PIPE, run
+from sys import path
+from tempfile import TemporaryDirectory
+from time import time
+from typing import Callable, Dict, Iterator, Tuple
+
+__dir__ = dirname(dirname(realpath(__file__)))
+RPLUGIN = join(__dir__, "rplugin", "python3")
+path.append(RPLUGIN)
+
+from chadtree.cartographer import _new  # noqa: E402
+from chadtree.gitignore import _ignored, watch  # noqa: E402
+from chadtree.gitindex import observe, read_index, replay, settle  # noqa: E402
+
+GIT_DIR = ".git"
+VERSIONS = (2, 3, 4)
+FILES = (
+    ".gitignore",
+    "a.txt",
+    "b.txt",
+    "dir/c.txt",
+    "dir/nested/d.txt",
+    "dir/nested/e.txt",
+)
+SKIP_WORKTREE = "dir/c.txt"
+UNTRACKED = ("app.log", "logs/old.log", "notes.txt")
+SEEDS = 20
+STEPS = 12
+GIT_ENV = {
+    **environ,
+    "LC_ALL": "C",
+    "GIT_AUTHOR_NAME": "ci",
+    "GIT_AUTHOR_EMAIL": "ci@localhost",
+    "GIT_COMMITTER_NAME": "ci",
+    "GIT_COMMITTER_EMAIL": "ci@localhost",
+}
+
+
+def git(cwd: str, *args: str) -> str:
+    proc = run(
+        ("git", *args), cwd=cwd, env=GIT_ENV, stdout=PIPE, universal_newlines=True
+    )
+    if proc.returncode:
+        raise SystemExit(f"git {' '.join(args)} failed in {cwd}")
+    return proc.stdout
+
+
+def porcelain(top: str, *args: str) -> Dict[str, str]:
+    cmd = ("status", "--renames", "--porcelain", "-z", *args)
+    it = iter(git(top, *cmd).split("\0"))
+
+    def cont() -> Iterator[Tuple[str, str]]:
+        for line in it:
+            prefix, file = line[:2], line[3:]
+            if file:
+                yield file.rstrip("/"), prefix
+            if "R" in prefix:
+                next(it, None)
+
+    return dict(cont())
+
+
+def write(top: str, name: str, text: str) -> None:
+    with open(join(top, name), "w") as fd:
+        fd.write(text)
+
+
+def setup(top: str, version: int) -> None:
+    git(top, "init", "--quiet")
+    git(top, "config", "core.excludesFile", excludes(top))
+    past = time() - 60
+    for name in FILES:
+        makedirs(dirname(join(top, name)), exist_ok=True)
+        write(top, name, "*.log\n" if name == ".gitignore" else name)
+        utime(join(top, name), (past, past))
+    git(top, "add", "--all")
+    git(top, "commit", "--quiet", "--message", "init")
+    git(top, "update-index", "--index-version", str(version))
+    if version >= 3:
+        git(top, "update-index", "--skip-worktree", SKIP_WORKTREE)
+    makedirs(join(top, "empty"))
+    makedirs(join(top, "logs"))
+    for name in UNTRACKED:
+        write(top, name, name)
+    git(top, "status", "--porcelain")
+
+
+def excludes(top: str) -> str:
+    return join(dirname(top), "excludes")
+
+
+def append(top: str, name: str, text: str) -> None:
+    with open(join(top, name), "a") as fd:
+        fd.write(text)
+
+
+def grow(top: str) -> None:
+    write(top, "a.txt", "a.txt grown")
+
+
+def same_size(top: str) -> None:
+    write(top, "a.txt", "A.TXT")
+
+
+def delete(top: str) -> None:
+    remove(join(top, "dir/nested/d.txt"))
+
+
+def untracked(top: str) -> None:
+    write(top, "dir/new.txt", "new")
+
+
+def stage(top: str) -> None:
+    write(top, "b.txt", "b.txt staged")
+    git(top, "add", "b.txt")
+
+
+def grow_nested(top: str) -> None:
+    write(top, "a.txt", "a.txt grown")
+    write(top, "dir/nested/e.txt", "dir/nested/e.txt grown")
+
+
+def fill_empty(top: str) -> None:
+    write(top, "empty/file.txt", "new")
+
+
+def fill_ignored(top: str) -> None:
+    write(top, "logs/file.txt", "new")
+
+
+def unignore(top: str) -> None:
+    append(top, ".gitignore", "!app.log\n")
+
+
+def info_exclude(top: str) -> None:
+    makedirs(join(top, ".git", "info"), exist_ok=True)
+    append(top, join(".git", "info", "exclude"), "notes.txt\n")
+
+
+def excludes_file(top: str) -> None:
+    append(top, excludes(top), "notes.txt\n")
+
+
+EDITS: Dict[str, Callable[[str], None]] = {
+    "noop": lambda top: None,
+    "grow": grow,
+    "same size": same_size,
+    "delete": delete,
+    "untracked": untracked,
+    "stage": stage,
+    "grow nested": grow_nested,
+    "new file in empty dir": fill_empty,
+    "new file in ignored-only dir": fill_ignored,
+    "unignore in .gitignore": unignore,
+    "info/exclude": info_exclude,
+    "core.excludesFile": excludes_file,
+}
+REPLAYABLE = {"noop", "grow", "grow nested"}
+
+
+def fuzz(top: str, rand: Random) -> str:
+    files = sorted(
+        relpath(join(root, name), top)
+        for root, _, names in walk(top)
+        if GIT_DIR not in relpath(root, top).split(sep)
+        for name in names
+    )
+    dirs = sorted({dirname(name) for name in files} | {"empty", "logs", "fresh"})
+    op = rand.choice(("grow", "rewrite", "create", "remove", "ignore", "stage"))
+    name = rand.choice(files)
+    if op == "grow":
+        append(top, name, "+" * rand.randint(1, 3))
+    elif op == "rewrite":
+        with open(join(top, name)) as fd:
+            text = fd.read()
+        write(top, name, text.swapcase())
+    elif op == "create":
+        parent = rand.choice(dirs)
+        makedirs(join(top, parent), exist_ok=True)
+        name = join(parent, f"{rand.randint(0, 99)}.{rand.choice(('txt', 'log'))}")
+        write(top, name, name)
+    elif op == "remove":
+        remove(join(top, name))
+    elif op == "ignore":
+        name = join(rand.choice(dirs), ".gitignore")
+        makedirs(dirname(join(top, name)), exist_ok=True)
+        append(top, name, rand.choice(("*.txt\n", "!*.log\n", "fresh/\n")))
+    elif name != SKIP_WORKTREE:
+        git(top, "add", "--force", "--", name)
+    return f"{op} {name}"
+
+
+def parity(top: str, name: str) -> Callable[[], bool]:
+    watch_top = partial(watch, excludes=excludes(top))
+    before = observe(top, (), watch_top)
+    if before is None:
+        raise SystemExit(f"{name}: index not observable")
+    snapshot = settle(top, before, porcelain(top))
+
+    def cont() -> bool:
+        nonlocal snapshot
+        after = observe(top, snapshot.untracked, watch_top)
+        replayed = replay(snapshot, after) if after else None
+        actual = porcelain(top)
+        if replayed is not None and replayed != actual:
+            raise SystemExit(f"{name}: replay {replayed} != git {actual}")
+        if after:
+            snapshot = settle(top, after, actual)
+        return replayed is not None
+
+    return cont
+
+
+def check(version: int, name: str, edit: Callable[[str], None]) -> bool:
+    with TemporaryDirectory() as tmp:
+        top = join(realpath(tmp), "repo")
+        makedirs(top)
+        setup(top, version)
+
+        index = join(top, ".git", "index")
+        listed = {entry.path for entry in read_index(index)}
+        expected = set(git(top, "ls-files", "-z").split("\0")) - {""}
+        if listed != expected:
+            raise SystemExit(f"v{version}: read_index {listed} != {expected}")
+
+        step = parity(top, name=f"v{version} {name}")
+        edit(top)
+        return step()
+
+
+def check_fuzz(version: int, seed: int) -> int:
+    rand = Random(seed)
+    with TemporaryDirectory() as tmp:
+        top = join(realpath(tmp), "repo")
+        makedirs(top)
+        setup(top, version)
+        step = parity(top, name=f"v{version} seed {seed}")
+        replayed = 0
+        for _ in range(STEPS):
+            op = fuzz(top, rand)
+            try:
+                replayed += step()
+            except SystemExit as e:
+                raise SystemExit(f"{e} after {op}")
+        return replayed
+
+
+IGNORE_FILES = (
+    "build/junk.o",
+    "build/keep.txt",
+    "src/app.log",
+    "src/tracked.log",
+    "src/main.c",
+)
+IGNORE_TRACKED = ("build/keep.txt", "src/tracked.log", "src/main.c")
+
+
+def check_ignored() -> None:
+    with TemporaryDirectory() as tmp:
+        top = realpath(tmp)
+        git(top, "init", "--quiet")
+        for name in IGNORE_FILES:
+            makedirs(dirname(join(top, name)), exist_ok=True)
+            write(top, name, name)
+        write(top, ".gitignore", "build/\n*.log\n")
+        git(top, "add", "--force", *IGNORE_TRACKED)
+
+        dirs = {root for root, _, _ in walk(top) if GIT_DIR not in root.split(sep)}
+        ignored = _ignored(_new(top, index=dirs), excludes="")
+        actual = {relpath(path, top) for path in ignored}
+
+        reported = porcelain(top, "--ignored")
+        roots = tuple(path for path, stat in reported.items() if stat == "!!")
+        paths = {relpath(path, top) for path in dirs - {top}} | set(IGNORE_FILES)
+        expected = {
+            path
+            for path in paths
+            if any(path == r or path.startswith(r + "/") for r in roots)
+        }
+        if actual != expected:
+            raise SystemExit(f"ignored {sorted(actual)} != git {sorted(expected)}")
+        print("ignore rules: match git")
+
+
+def main() -> None:
+    check_ignored()
+    for version in VERSIONS:
+        for name, edit in EDITS.items():
+            replayed = check(version, name, edit)
+            verdict = "replayed" if replayed else "fell back"
+            print(f"index v{version} {name}: {verdict}")
+            if name in REPLAYABLE and not replayed:
+                raise SystemExit(f"v{version} {name}: expected a replay")
+        hits = sum(check_fuzz(version, seed=seed) for seed in range(SEEDS))
+        print(f"index v{version} random edits: {hits}/{SEEDS * STEPS} replayed")
+
+
+main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+from os import environ
+from os.path import dirname, join, realpath
+from subprocess import PIPE, run
+from sys import executable
+from typing import Dict, Iterator, Tuple
+
+__dir__ = dirname(dirname(realpath(__file__)))
+RPLUGIN = join(__dir__, "rplugin", "python3")
+
+BUDGET_US = 150_000
+RUNS = 5
+DEFERRED = {
+    "argparse",
+    "mimetypes",
+    "shutil",
+    "chadtree.cartographer",
+    "chadtree.fs",
+    "chadtree.git",
+    "chadtree.render",
+    "chadtree.state",
+    "chadtree.transitions",
+    "chadtree.wm",
+}
+
+
+def parse(stderr: str) -> Iterator[Tuple[str, int]]:
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                yield name.strip(), int(cumulative)
+
+
+def importtime() -> Dict[str, int]:
+    env = {**environ, "PYTHONPATH": RPLUGIN}
+    code = "import pynvim; import chadtree"
+    proc = run(
+        (executable, "-X", "importtime", "-c", code),
+        env=env,
+        stderr=PIPE,
+        universal_newlines=True,
+    )
+    if proc.returncode:
+        raise SystemExit(proc.stderr)
+    return dict(parse(proc.stderr))
+
+
+def main() -> None:
+    samples = tuple(importtime() for _ in range(RUNS))
+    best = min(sample["chadtree"] for sample in samples)
+    eager = DEFERRED & samples[0].keys()
+
+    print(f"import chadtree: {best / 1000:.1f}ms (budget {BUDGET_US / 1000:.0f}ms)")
+    if eager:
+        raise SystemExit(f"imported at startup: {', '.join(sorted(eager))}")
+    if best > BUDGET_US:
+        raise SystemExit("import time over budget")
+
+
+main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+from asyncio import (
+    AbstractEventLoop,
+    Event,
+    Lock,
+    new_event_loop,
+    run_coroutine_threadsafe,
+)
+from concurrent.futures import Future
+from queue import SimpleQueue
+from threading import Thread
+from time import perf_counter
+from typing import Any, Callable, Coroutine, Dict
+
+COMMANDS = 5000
+RUNS = 5
+
+Submit = Callable[[Coroutine[Any, Any, None]], None]
+
+
+def blocking(loop: AbstractEventLoop) -> Submit:
+    chan: SimpleQueue = SimpleQueue()
+
+    def ooda() -> None:
+        while True:
+            f = chan.get()
+            f()
+
+    Thread(target=ooda, daemon=True).start()
+
+    def submit(co: Coroutine[Any, Any, None]) -> None:
+        def run() -> None:
+            fut = run_coroutine_threadsafe(co, loop)
+            fut.result()
+
+        chan.put_nowait(run)
+
+    return submit
+
+
+def callback(loop: AbstractEventLoop) -> Submit:
+    def submit(co: Coroutine[Any, Any, None]) -> None:
+        def cont(fut: Future) -> None:
+            fut.result()
+
+        fut = run_coroutine_threadsafe(co, loop)
+        fut.add_done_callback(cont)
+
+    return submit
+
+
+def throughput(strategy: Callable[[AbstractEventLoop], Submit]) -> float:
+    loop = new_event_loop()
+    submit = strategy(loop)
+
+    async def bench() -> float:
+        lock, done = Lock(), Event()
+        remaining = COMMANDS
+
+        async def command() -> None:
+            nonlocal remaining
+            async with lock:
+                remaining -= 1
+                if not remaining:
+                    done.set()
+
+        t1 = perf_counter()
+        for _ in range(COMMANDS):
+            submit(command())
+        await done.wait()
+        return COMMANDS / (perf_counter() - t1)
+
+    try:
+        return loop.run_until_complete(bench())
+    finally:
+        loop.close()
+
+
+def main() -> None:
+    strategies: Dict[str, Callable[[AbstractEventLoop], Submit]] = {
+        "blocking .result() thread": blocking,
+        "run_coroutine_threadsafe + callback": callback,
+    }
+    for name, strategy in strategies.items():
+        best = max(throughput(strategy) for _ in range(RUNS))
+        print(f"{name}: {best / 1000:.1f}k commands/s")
+
+
+main()
@@ -4,61 +4,56 @@ from asyncio import (
     Lock,
     create_task,
     run_coroutine_threadsafe,
+    sleep,
+    wait,
 )
-from itertools import chain
+from concurrent.futures import Future
 from operator import add, sub
-from typing import Any, Awaitable, Callable, Optional, Sequence
+from os.path import expanduser, join
+from time import monotonic
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Counter,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    cast,
+)
 
 from pynvim import Nvim, command, function, plugin
 from pynvim.api.common import NvimError
 
 from .consts import colours_var, ignores_var, settings_var, view_var
-from .executor import Executor
-from .highlight import add_hl_groups
+from .da import configure_pools, run_in_executor
+from .lazy import lazy
 from .logging import log, setup
-from .nvim import autocmd, run_forever
-from .scheduler import schedule
+from .metrics import observe, pretty, register, snapshot
+from .nvim import autocmd, call, getcwd, instrument, print, run_forever
+from .priority import PriorityLock
+from .scheduler import Scheduler
 from .settings import initial as initial_settings
-from .state import initial as initial_state
-from .transitions import (
-    a_changedir,
-    a_follow,
-    a_quickfix,
-    a_session,
-    c_change_focus,
-    c_change_focus_up,
-    c_clear_filter,
-    c_clear_selection,
-    c_click,
-    c_collapse,
-    c_copy,
-    c_copy_name,
-    c_cut,
-    c_delete,
-    c_hidden,
-    c_jump_to_current,
-    c_new,
-    c_new_filter,
-    c_new_search,
-    c_open,
-    c_open_system,
-    c_quit,
-    c_refresh,
-    c_rename,
-    c_resize,
-    c_select,
-    c_stat,
-    c_toggle_follow,
-    c_toggle_vc,
-    c_trash,
-    redraw,
-)
-from .types import ClickType, Stage, State
+from .tracing import dump_trace, is_tracing, span, start, stop, traced
+from .types import ClickType, Priority, Stage, State, Workload
+
+if TYPE_CHECKING:
+    from . import cartographer, state, transitions, wm
+else:
+    cartographer, state, transitions, wm = (
+        lazy(f"{__name__}.{name}")
+        for name in ("cartographer", "state", "transitions", "wm")
+    )
 
 
 @plugin
 class Main:
     def __init__(self, nvim: Nvim):
+        instrument(nvim)
         user_config = nvim.vars.get(settings_var, {})
         user_view = nvim.vars.get(view_var, {})
         user_ignores = nvim.vars.get(ignores_var, {})
@@ -70,89 +65,241 @@ class Main:
             user_colours=user_colours,
         )
         self.settings = settings
+        configure_pools(settings.executors)
         self.state: Optional[State] = None
 
-        self.chan = Executor()
         self.ch = Event()
-        self.lock = Lock()
+        self.active = Event()
+        self.focused = True
+        self.visible = False
+        self.lock = PriorityLock()
+        self.pending: Set[str] = set()
+        self.merged: Counter[str] = Counter()
+        self.dropped: Counter[str] = Counter()
+        self.frame = Event()
+        self.focus: Optional[str] = None
+        self.drawing = Lock()
+        self.scheduler = Scheduler(self.ch, update=settings.update)
         self.nvim = nvim
+        register("lock", self.lock.stats)
+        register("scheduler", self.scheduler.stats)
+        register("events", self._event_stats)
 
         setup(nvim, settings.logging_level)
         log.debug("")
         self._init = create_task(self._initialize())
         run_forever(self.nvim, self._ooda_loop)
+        run_forever(self.nvim, self._frame_loop)
 
-    def _submit(self, co: Awaitable[None]) -> None:
+    def _submit(self, co: Coroutine[Any, Any, None]) -> None:
         loop: AbstractEventLoop = self.nvim.loop
 
-        def run(nvim: Nvim) -> None:
-            fut = run_coroutine_threadsafe(co, loop)
+        def cont(fut: Future) -> None:
             try:
                 fut.result()
             except Exception as e:
                 log.exception("%s", str(e))
 
-        self.chan.run_sync(run, self.nvim)
+        fut = run_coroutine_threadsafe(co, loop)
+        fut.add_done_callback(cont)
+
+    def _activate(
+        self, *, focused: Optional[bool] = None, visible: Optional[bool] = None
+    ) -> None:
+        self.focused = self.focused if focused is None else focused
+        self.visible = self.visible if visible is None else visible
+        if self.focused and self.visible:
+            if not self.active.is_set():
+                self.active.set()
+                if self.scheduler.waiting:
+                    self.ch.set()
+        else:
+            self.active.clear()
 
     async def _curr_state(self) -> State:
         if not self.state:
-            self.state = await initial_state(self.nvim, settings=self.settings)
+            self.state = await state.initial(self.nvim, settings=self.settings)
+            self._submit(self._progress(self.state.root.path))
 
         return self.state
 
-    def _run(
-        self, fn: Callable[..., Awaitable[Optional[Stage]]], *args: Any, **kwargs: Any
+    async def _progress(self, cwd: str) -> None:
+        phases: Sequence[Tuple[Callable[..., Awaitable[Optional[Stage]]], Any]] = (
+            (transitions.restore, {"cwd": cwd}),
+            (transitions.decorate, {}),
+        )
+        for fn, kwargs in phases:
+            while True:
+                task = create_task(
+                    self._transition(fn, priority=Priority.background, **kwargs)
+                )
+                await wait((task,))
+                if task.cancelled():
+                    log.debug("%s", "initial phase pre-empted")
+                else:
+                    task.result()
+                    break
+
+    def _mark(self, focus: Optional[str]) -> None:
+        if self.frame.is_set():
+            self.dropped["frame"] += 1
+        self.focus = focus or self.focus
+        self.frame.set()
+
+    async def _flush(self) -> None:
+        async with self.drawing:
+            if self.frame.is_set():
+                self.frame.clear()
+                focus, self.focus = self.focus, None
+                state = cast(State, self.state)
+                visible = await transitions.redraw(self.nvim, state=state, focus=focus)
+                self._activate(visible=visible)
+
+    async def _frame_loop(self) -> None:
+        while True:
+            await self.frame.wait()
+            t1 = monotonic()
+            try:
+                await self._flush()
+            except NvimError as e:
+                log.warning("%s", str(e))
+                self.ch.set()
+            await sleep(self.settings.update.frame_time - (monotonic() - t1))
+
+    async def _transition(
+        self,
+        fn: Callable[..., Awaitable[Optional[Stage]]],
+        *args: Any,
+        priority: Priority,
+        event: Optional[str] = None,
+        **kwargs: Any,
     ) -> None:
-        async def run() -> None:
-            async with self.lock:
+        name = f"transitions.{fn.__name__}"
+        t1 = monotonic()
+        with span(name):
+            async with self.lock.acquire(priority):
+                observe("lock.wait_ms", (monotonic() - t1) * 1000)
+                if event:
+                    self.pending.discard(event)
                 await self._init
+                if priority is Priority.user:
+                    try:
+                        await self._flush()
+                    except NvimError as e:
+                        log.warning("%s", str(e))
+                        self.ch.set()
                 state = await self._curr_state()
                 stage = await fn(
                     self.nvim, state=state, settings=self.settings, *args, **kwargs
                 )
                 if stage:
                     self.state = stage.state
-                    await redraw(self.nvim, state=self.state, focus=stage.focus)
+                    self._mark(stage.focus)
+        observe(f"{name}_ms", (monotonic() - t1) * 1000)
+
+    def _run(
+        self,
+        fn: Callable[..., Awaitable[Optional[Stage]]],
+        *args: Any,
+        priority: Priority = Priority.user,
+        **kwargs: Any,
+    ) -> None:
+        self._submit(self._transition(fn, *args, priority=priority, **kwargs))
 
-        self._submit(run())
+    def _coalesce(
+        self, event: str, fn: Callable[..., Awaitable[Optional[Stage]]]
+    ) -> None:
+        if event in self.pending:
+            self.merged[event] += 1
+        else:
+            self.pending.add(event)
+
+            async def run() -> None:
+                await sleep(self.settings.update.frame_time)
+                await self._transition(fn, priority=Priority.autocmd, event=event)
+
+            self._submit(run())
 
     async def _initialize(self) -> None:
+        cartographer.configure_cache(self.settings.cache_nodes)
+
         await autocmd(
-            self.nvim, events=("DirChanged",), fn="_CHADchange_dir",
+            self.nvim,
+            events=("DirChanged",),
+            fn="_CHADchange_dir",
         )
 
         await autocmd(
-            self.nvim, events=("BufEnter",), fn="_CHADfollow",
+            self.nvim,
+            events=("BufEnter",),
+            fn="_CHADfollow",
         )
 
         await autocmd(
-            self.nvim, events=("BufWritePost", "FocusGained"), fn="CHADschedule_update",
+            self.nvim,
+            events=("BufWritePost", "FocusGained"),
+            fn="CHADschedule_update",
         )
 
         await autocmd(self.nvim, events=("FocusLost", "ExitPre"), fn="_CHADsession")
 
-        await autocmd(self.nvim, events=("QuickfixCmdPost",), fn="_CHADquickfix")
+        await autocmd(
+            self.nvim, events=("FocusGained",), fn="_CHADfocus", arg_eval=("v:true",)
+        )
 
-        groups = chain(
-            self.settings.hl_context.groups, self.settings.icons.colours.exts.values(),
+        await autocmd(
+            self.nvim, events=("FocusLost",), fn="_CHADfocus", arg_eval=("v:false",)
         )
-        await add_hl_groups(self.nvim, groups=groups)
+
+        await autocmd(self.nvim, events=("QuickfixCmdPost",), fn="_CHADquickfix")
+
+        def supported() -> Sequence[str]:
+            events = (*wm.BUF_EVENTS, *wm.DEL_EVENTS, *wm.WIN_EVENTS)
+            return tuple(e for e in events if self.nvim.funcs.exists(f"##{e}"))
+
+        for event in await call(self.nvim, supported):
+            await autocmd(
+                self.nvim,
+                events=(event,),
+                fn="_CHADtopology",
+                prelude=(wm.TOPOLOGY_PRELUDE,),
+                arg_eval=wm.topology_args(event),
+            )
+
+    @traced
+    async def _refresh(self, scheduler: Scheduler) -> None:
+        async with self.lock.acquire(Priority.background):
+            t1 = monotonic()
+            state = await self._curr_state()
+            try:
+                stage = await transitions.c_refresh(
+                    self.nvim, state=state, settings=self.settings
+                )
+            except NvimError:
+                self.ch.set()
+            else:
+                self.state = stage.state
+                self._mark(None)
+                changed = stage.state.rendered is not state.rendered
+                scheduler.report(monotonic() - t1, changed=changed)
 
     async def _ooda_loop(self) -> None:
-        update = self.settings.update
-        async for _ in schedule(
-            self.ch, min_time=update.min_time, max_time=update.max_time,
-        ):
-            async with self.lock:
-                state = await self._curr_state()
-                try:
-                    stage = await c_refresh(
-                        self.nvim, state=state, settings=self.settings
-                    )
-                    self.state = stage.state
-                    await redraw(self.nvim, state=self.state, focus=None)
-                except NvimError:
-                    self.ch.set()
+        async for _ in self.scheduler.ticks():
+            await self.active.wait()
+            task = create_task(self._refresh(self.scheduler))
+            await wait((task,))
+            if task.cancelled():
+                log.debug("%s", "background refresh pre-empted")
+                self.ch.set()
+            else:
+                task.result()
+                if self.settings.prefetch.enable and self.state:
+                    try:
+                        await transitions.prefetch(
+                            self.nvim, state=self.state, settings=self.settings
+                        )
+                    except NvimError as e:
+                        log.warning("%s", str(e))
 
     @command("CHADopen", nargs="*")
     def fm_open(self, c_args: str = "", *args: Any, **kwargs: Any) -> None:
@@ -160,7 +307,7 @@ class Main:
         Toggle sidebar
         """
 
-        self._run(c_open, args=c_args)
+        self._run(transitions.c_open, args=c_args)
 
     @function("CHADschedule_update")
     def schedule_udpate(self, args: Sequence[Any]) -> None:
@@ -168,7 +315,30 @@ class Main:
         Follow directory
         """
 
-        self.ch.set()
+        if not self.active.is_set():
+            self.dropped["update"] += 1
+        elif self.ch.is_set():
+            self.merged["update"] += 1
+        else:
+            self.ch.set()
+
+    @function("_CHADfocus")
+    def on_focus(self, args: Sequence[Any]) -> None:
+        """
+        Pause / resume background refresh
+        """
+        focused, *_ = args
+
+        self._activate(focused=focused)
+
+    @function("_CHADtopology")
+    def on_topology(self, args: Sequence[Any]) -> None:
+        """
+        Mirror buffer / window changes
+        """
+        gen, event, number, name, ft = args
+
+        wm.on_topology_event(gen, event=event, number=number, name=name, ft=ft)
 
     @function("_CHADchange_dir")
     def on_changedir(self, args: Sequence[Any]) -> None:
@@ -176,7 +346,7 @@ class Main:
         Follow files
         """
 
-        self._run(a_changedir)
+        self._run(transitions.a_changedir, priority=Priority.autocmd)
 
     @function("_CHADfollow")
     def on_bufenter(self, args: Sequence[Any]) -> None:
@@ -184,7 +354,7 @@ class Main:
         Follow buffer
         """
 
-        self._run(a_follow)
+        self._coalesce("follow", transitions.a_follow)
 
     @function("_CHADsession")
     def on_leave(self, args: Sequence[Any]) -> None:
@@ -192,7 +362,7 @@ class Main:
         Follow buffer
         """
 
-        self._run(a_session)
+        self._run(transitions.a_session, priority=Priority.autocmd)
 
     @function("_CHADquickfix")
     def on_quickfix(self, args: Sequence[Any]) -> None:
@@ -200,7 +370,7 @@ class Main:
         Update quickfix list
         """
 
-        self._run(a_quickfix)
+        self._coalesce("quickfix", transitions.a_quickfix)
 
     @function("CHADquit")
     def quit(self, args: Sequence[Any]) -> None:
@@ -208,7 +378,7 @@ class Main:
         Close sidebar
         """
 
-        self._run(c_quit)
+        self._run(transitions.c_quit)
 
     @function("CHADchange_focus")
     def change_focus(self, args: Sequence[Any]) -> None:
@@ -216,7 +386,7 @@ class Main:
         Refocus root directory
         """
 
-        self._run(c_change_focus)
+        self._run(transitions.c_change_focus)
 
     @function("CHADchange_focus_up")
     def change_focus_up(self, args: Sequence[Any]) -> None:
@@ -224,7 +394,7 @@ class Main:
         Refocus root directory up
         """
 
-        self._run(c_change_focus_up)
+        self._run(transitions.c_change_focus_up)
 
     @function("CHADrefocus")
     def refocus(self, args: Sequence[Any]) -> None:
@@ -232,7 +402,7 @@ class Main:
         Refocus root directory to cwd
         """
 
-        self._run(a_changedir)
+        self._run(transitions.a_changedir)
 
     @function("CHADstat")
     def stat(self, args: Sequence[Any]) -> None:
@@ -240,7 +410,7 @@ class Main:
         Print file stat to cmdline
         """
 
-        self._run(c_stat)
+        self._run(transitions.c_stat)
 
     @function("CHADjump_to_current")
     def jump_to_current(self, args: Sequence[Any]) -> None:
@@ -248,7 +418,7 @@ class Main:
         Jump to active file
         """
 
-        self._run(c_jump_to_current)
+        self._run(transitions.c_jump_to_current)
 
     @function("CHADprimary")
     def primary(self, args: Sequence[Any]) -> None:
@@ -257,7 +427,7 @@ class Main:
         File -> open
         """
 
-        self._run(c_click, click_type=ClickType.primary)
+        self._run(transitions.c_click, click_type=ClickType.primary)
 
     @function("CHADsecondary")
     def secondary(self, args: Sequence[Any]) -> None:
@@ -266,7 +436,7 @@ class Main:
         File -> preview
         """
 
-        self._run(c_click, click_type=ClickType.secondary)
+        self._run(transitions.c_click, click_type=ClickType.secondary)
 
     @function("CHADtertiary")
     def tertiary(self, args: Sequence[Any]) -> None:
@@ -275,7 +445,7 @@ class Main:
         File -> open in new tab
         """
 
-        self._run(c_click, click_type=ClickType.tertiary)
+        self._run(transitions.c_click, click_type=ClickType.tertiary)
 
     @function("CHADv_split")
     def v_split(self, args: Sequence[Any]) -> None:
@@ -284,7 +454,7 @@ class Main:
         File -> open in vertical split
         """
 
-        self._run(c_click, click_type=ClickType.v_split)
+        self._run(transitions.c_click, click_type=ClickType.v_split)
 
     @function("CHADh_split")
     def h_split(self, args: Sequence[Any]) -> None:
@@ -293,7 +463,7 @@ class Main:
         File -> open in horizontal split
         """
 
-        self._run(c_click, click_type=ClickType.h_split)
+        self._run(transitions.c_click, click_type=ClickType.h_split)
 
     @function("CHADbigger")
     def bigger(self, args: Sequence[Any]) -> None:
@@ -301,7 +471,7 @@ class Main:
         Bigger sidebar
         """
 
-        self._run(c_resize, direction=add)
+        self._run(transitions.c_resize, direction=add)
 
     @function("CHADsmaller")
     def smaller(self, args: Sequence[Any]) -> None:
@@ -309,7 +479,7 @@ class Main:
         Smaller sidebar
         """
 
-        self._run(c_resize, direction=sub)
+        self._run(transitions.c_resize, direction=sub)
 
     @function("CHADrefresh")
     def refresh(self, args: Sequence[Any]) -> None:
@@ -317,7 +487,7 @@ class Main:
         Redraw buffers
         """
 
-        self._run(c_refresh, write=True)
+        self._run(transitions.c_refresh, write=True)
 
     @function("CHADcollapse")
     def collapse(self, args: Sequence[Any]) -> None:
@@ -325,7 +495,7 @@ class Main:
         Collapse folder
         """
 
-        self._run(c_collapse)
+        self._run(transitions.c_collapse)
 
     @function("CHADtoggle_hidden")
     def hidden(self, args: Sequence[Any]) -> None:
@@ -333,7 +503,7 @@ class Main:
         Toggle hidden
         """
 
-        self._run(c_hidden)
+        self._run(transitions.c_hidden)
 
     @function("CHADtoggle_follow")
     def toggle_follow(self, args: Sequence[Any]) -> None:
@@ -341,7 +511,7 @@ class Main:
         Toggle follow
         """
 
-        self._run(c_toggle_follow)
+        self._run(transitions.c_toggle_follow)
 
     @function("CHADtoggle_version_control")
     def toggle_vc(self, args: Sequence[Any]) -> None:
@@ -349,7 +519,7 @@ class Main:
         Toggle version control
         """
 
-        self._run(c_toggle_vc)
+        self._run(transitions.c_toggle_vc)
 
     @function("CHADfilter")
     def filter_pattern(self, args: Sequence[Any]) -> None:
@@ -357,7 +527,7 @@ class Main:
         Update filter
         """
 
-        self._run(c_new_filter)
+        self._run(transitions.c_new_filter)
 
     @function("CHADsearch")
     def search_pattern(self, args: Sequence[Any]) -> None:
@@ -365,7 +535,7 @@ class Main:
         Update search
         """
 
-        self._run(c_new_search)
+        self._run(transitions.c_new_search)
 
     @function("CHADcopy_name")
     def copy_name(self, args: Sequence[Any]) -> None:
@@ -374,7 +544,7 @@ class Main:
         """
         is_visual, *_ = args
 
-        self._run(c_copy_name, is_visual=is_visual)
+        self._run(transitions.c_copy_name, is_visual=is_visual)
 
     @function("CHADnew")
     def new(self, args: Sequence[Any]) -> None:
@@ -382,7 +552,7 @@ class Main:
         new file / folder
         """
 
-        self._run(c_new)
+        self._run(transitions.c_new)
 
     @function("CHADrename")
     def rename(self, args: Sequence[Any]) -> None:
@@ -390,7 +560,7 @@ class Main:
         rename file / folder
         """
 
-        self._run(c_rename)
+        self._run(transitions.c_rename)
 
     @function("CHADclear_selection")
     def clear_selection(self, args: Sequence[Any]) -> None:
@@ -398,7 +568,7 @@ class Main:
         Clear selected
         """
 
-        self._run(c_clear_selection)
+        self._run(transitions.c_clear_selection)
 
     @function("CHADclear_filter")
     def clear_filter(self, args: Sequence[Any]) -> None:
@@ -406,7 +576,7 @@ class Main:
         Clear selected
         """
 
-        self._run(c_clear_filter)
+        self._run(transitions.c_clear_filter)
 
     @function("CHADselect")
     def select(self, args: Sequence[Any]) -> None:
@@ -415,7 +585,7 @@ class Main:
         """
         is_visual, *_ = args
 
-        self._run(c_select, is_visual=is_visual)
+        self._run(transitions.c_select, is_visual=is_visual)
 
     @function("CHADdelete")
     def delete(self, args: Sequence[Any]) -> None:
@@ -424,7 +594,7 @@ class Main:
         """
         is_visual, *_ = args
 
-        self._run(c_delete, is_visual=is_visual)
+        self._run(transitions.c_delete, is_visual=is_visual)
 
     @function("CHADtrash")
     def trash(self, args: Sequence[Any]) -> None:
@@ -433,7 +603,7 @@ class Main:
         """
         is_visual, *_ = args
 
-        self._run(c_trash, is_visual=is_visual)
+        self._run(transitions.c_trash, is_visual=is_visual)
 
     @function("CHADcut")
     def cut(self, args: Sequence[Any]) -> None:
@@ -441,7 +611,7 @@ class Main:
         Cut selected
         """
 
-        self._run(c_cut)
+        self._run(transitions.c_cut)
 
     @function("CHADcopy")
     def copy(self, args: Sequence[Any]) -> None:
@@ -449,7 +619,7 @@ class Main:
         Copy selected
         """
 
-        self._run(c_copy)
+        self._run(transitions.c_copy)
 
     @function("CHADopen_sys")
     def open_sys(self, args: Sequence[Any]) -> None:
@@ -457,4 +627,51 @@ class Main:
         Open using finder / dolphin, etc
         """
 
-        self._run(c_open_system)
+        self._run(transitions.c_open_system)
+
+    async def _trace(self, args: Sequence[str]) -> None:
+        action, *paths = args or ("",)
+        if action == "start" and not paths:
+            start()
+            await print(self.nvim, "tracing...")
+        elif action == "stop" and len(paths) == 1 and is_tracing():
+            events = stop()
+            cwd = await getcwd(self.nvim)
+            path = join(cwd, expanduser(*paths))
+            await run_in_executor(dump_trace, path, events, pool=Workload.persistence)
+            await print(self.nvim, f"trace written to {path}")
+        elif action == "stop" and not is_tracing():
+            await print(self.nvim, "not tracing", error=True)
+        else:
+            await print(self.nvim, "usage: CHADtrace start | stop <file>", error=True)
+
+    @command("CHADtrace", nargs="*")
+    def trace(self, args: Sequence[str]) -> None:
+        """
+        Record trace events
+        """
+
+        self._submit(self._trace(args))
+
+    def _event_stats(self) -> Mapping[str, Any]:
+        return {
+            "merged": dict(self.merged),
+            "dropped": dict(self.dropped),
+            "pending": len(self.pending),
+        }
+
+    @function("CHADstats", sync=True)
+    def stats(self, args: Sequence[Any]) -> Mapping[str, Any]:
+        """
+        Performance counters
+        """
+
+        return snapshot()
+
+    @command("CHADstats")
+    def stats_view(self) -> None:
+        """
+        Show performance counters
+        """
+
+        self._submit(print(self.nvim, pretty(snapshot())))
@@ -1,4 +1,5 @@
-from os import listdir, stat
+from asyncio import CancelledError, Task, create_task, shield
+from os import listdir, stat, stat_result
 from os.path import basename, join, splitext
 from stat import (
     S_IEXEC,
@@ -12,10 +13,30 @@ from stat import (
     S_ISVTX,
     S_IWOTH,
 )
-from typing import Dict, Iterator, Set, cast
+from threading import local
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    cast,
+)
 
 from .da import run_in_executor
-from .types import Index, Mode, Node
+from .dircache import DirCache
+from .fs import ancestors, is_parent
+from .metrics import incr, observe, register
+from .tracing import traced
+from .types import Index, Mode, Node, Workload
+
+T = TypeVar("T")
 
 FILE_MODES: Dict[int, Mode] = {
     S_IEXEC: Mode.executable,
@@ -25,6 +46,30 @@ FILE_MODES: Dict[int, Mode] = {
     S_ISUID: Mode.set_uid,
 }
 
+_cache = DirCache(capacity=0)
+_parked: Dict[Tuple[str, FrozenSet[str], FrozenSet[str]], Tuple[Node, Task]] = {}
+
+
+class _Tally(local):
+    def __init__(self) -> None:
+        self.nodes = 0
+        self.syscalls = 0
+
+
+_tally = _Tally()
+
+
+def _scan(fn: Callable[..., T], *args: Any) -> T:
+    _tally.nodes = _tally.syscalls = 0
+    try:
+        return fn(*args)
+    finally:
+        incr("scan.count")
+        incr("scan.nodes", _tally.nodes)
+        incr("scan.syscalls", _tally.syscalls)
+        observe("scan.nodes_per_scan", _tally.nodes)
+        observe("scan.syscalls_per_scan", _tally.syscalls)
+
 
 def fs_modes(stat: int) -> Iterator[Mode]:
     if S_ISDIR(stat):
@@ -40,65 +85,178 @@ def fs_modes(stat: int) -> Iterator[Mode]:
             yield mode
 
 
-def fs_stat(path: str) -> Set[Mode]:
+def fs_stat(path: str) -> Tuple[Set[Mode], Optional[stat_result]]:
+    _tally.syscalls += 1
     try:
         info = stat(path, follow_symlinks=False)
     except FileNotFoundError:
-        return {Mode.orphan_link}
+        return {Mode.orphan_link}, None
     else:
         if S_ISLNK(info.st_mode):
+            _tally.syscalls += 1
             try:
                 link_info = stat(path, follow_symlinks=True)
             except FileNotFoundError:
-                return {Mode.orphan_link}
+                return {Mode.orphan_link}, None
             else:
                 mode = {*fs_modes(link_info.st_mode)}
-                return mode | {Mode.link}
+                return mode | {Mode.link}, link_info
         else:
             mode = {*fs_modes(info.st_mode)}
-            return mode
+            return mode, info
 
 
-def _new(root: str, index: Index) -> Node:
-    mode = fs_stat(root)
+def _graft(root: str, index: Index, prev: Node) -> Node:
+    if root == prev.path:
+        return prev
+    elif is_parent(parent=prev.path, child=root):
+        node = prev
+        for path in (*ancestors(root), root):
+            if len(path) > len(prev.path):
+                child = (node.children or {}).get(path)
+                if child is None:
+                    return _new(root, index=index, cached=True)
+                node = child
+        if node.children is None:
+            return _new(root, index=index, cached=True)
+        else:
+            return node
+    elif is_parent(parent=root, child=prev.path) and root in index:
+        mode, _ = fs_stat(root)
+        _tally.syscalls += 1
+        children = {
+            path: _graft(path, index=index, prev=prev)
+            if path == prev.path or is_parent(parent=path, child=prev.path)
+            else _new(path, index=index, cached=True)
+            for path in (join(root, d) for d in listdir(root))
+        }
+        return Node(path=root, mode=mode, name=basename(root), children=children)
+    else:
+        return _new(root, index=index)
+
+
+def _shallow(node: Node) -> Node:
+    if node.children is None:
+        return node
+    else:
+        return Node(path=node.path, mode=node.mode, name=node.name, ext=node.ext)
+
+
+def _new(root: str, index: Index, cached: bool = False) -> Node:
+    _tally.nodes += 1
+    mode, info = fs_stat(root)
     name = basename(root)
-    if Mode.folder not in mode:
+    if info is None or Mode.folder not in mode:
         _, ext = splitext(name)
         return Node(path=root, mode=mode, name=name, ext=ext)
 
     elif root in index:
-        children = {
-            path: _new(path, index=index)
-            for path in (join(root, d) for d in listdir(root))
-        }
+        mtime = info.st_mtime_ns
+        hit = _cache.get(root, mtime=mtime) if cached else None
+        if hit is None:
+            _tally.syscalls += 1
+            children = {
+                path: _new(path, index=index, cached=cached)
+                for path in (join(root, d) for d in listdir(root))
+            }
+            if not _cache.fresh(root, mtime=mtime):
+                shallow = {path: _shallow(node) for path, node in children.items()}
+                _cache.put(root, mtime=mtime, children=shallow)
+        else:
+            children = {
+                path: _new(path, index=index, cached=True)
+                if path in index
+                else _shallow(node)
+                for path, node in hit.items()
+            }
         return Node(path=root, mode=mode, name=name, children=children)
     else:
         return Node(path=root, mode=mode, name=name)
 
 
+@traced
 async def new(root: str, index: Index) -> Node:
-    return await run_in_executor(_new, root, index)
+    return await run_in_executor(_scan, _new, root, index, pool=Workload.scan)
+
+
+async def graft(prev: Node, root: str, index: Index) -> Node:
+    return await run_in_executor(_scan, _graft, root, index, prev, pool=Workload.scan)
 
 
 def _update(root: Node, index: Index, paths: Set[str]) -> Node:
     if root.path in paths:
-        return _new(root.path, index=index)
+        fresh = _new(root.path, index=index, cached=root.children is None)
+        return root if fresh == root else fresh
     else:
-        children = {
-            k: _update(v, index=index, paths=paths)
-            for k, v in (root.children or cast(Dict[str, Node], {})).items()
-        }
-        return Node(
-            path=root.path,
-            mode=root.mode,
-            name=root.name,
-            children=children,
-            ext=root.ext,
-        )
+        prev = root.children or cast(Dict[str, Node], {})
+        children = {k: _update(v, index=index, paths=paths) for k, v in prev.items()}
+        if all(children[k] is v for k, v in prev.items()):
+            return root
+        else:
+            return Node(
+                path=root.path,
+                mode=root.mode,
+                name=root.name,
+                children=children,
+                ext=root.ext,
+            )
 
 
-async def update(root: Node, *, index: Index, paths: Set[str]) -> Node:
+async def _rescan(root: Node, index: Index, paths: Set[str]) -> Node:
     try:
-        return await run_in_executor(_update, root, index, paths)
+        return await run_in_executor(
+            _scan, _update, root, index, paths, pool=Workload.scan
+        )
     except FileNotFoundError:
         return await new(root.path, index=index)
+
+
+@traced
+async def update(root: Node, *, index: Index, paths: Set[str]) -> Node:
+    key = (root.path, frozenset(index), frozenset(paths))
+    parked = _parked.pop(key, None)
+    if parked and parked[0] is root:
+        _, task = parked
+    else:
+        task = create_task(_rescan(root, index, paths))
+
+    try:
+        return await shield(task)
+    except CancelledError:
+        _parked.clear()
+        _parked[key] = root, task
+        raise
+
+
+def _prefetch(path: str) -> None:
+    try:
+        mtime = stat(path).st_mtime_ns
+        _tally.syscalls += 1
+        if not _cache.fresh(path, mtime=mtime):
+            _tally.syscalls += 1
+            children = {
+                child: _new(child, index=set())
+                for child in (join(path, d) for d in listdir(path))
+            }
+            _cache.put(path, mtime=mtime, children=children)
+    except OSError:
+        pass
+
+
+async def prefetch(paths: Iterable[str]) -> None:
+    def cont() -> None:
+        for path in paths:
+            _prefetch(path)
+
+    await run_in_executor(_scan, cont, pool=Workload.scan)
+
+
+def configure_cache(capacity: int) -> None:
+    _cache.capacity = capacity
+
+
+def cache_stats() -> Mapping[str, float]:
+    return _cache.stats()
+
+
+register("cache", cache_stats)
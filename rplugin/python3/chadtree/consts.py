@@ -42,3 +42,5 @@ folder_mode = 0o755
 file_mode = 0o644
 
 throttle_duration = 1
+
+git_procs = 4
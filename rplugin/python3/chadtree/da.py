@@ -1,5 +1,13 @@
-from asyncio import create_subprocess_exec, get_running_loop
+from asyncio import (
+    CancelledError,
+    Semaphore,
+    create_subprocess_exec,
+    get_running_loop,
+    wrap_future,
+)
 from asyncio.subprocess import DEVNULL, PIPE
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import suppress
 from dataclasses import dataclass
 from functools import partial
 from itertools import count
@@ -9,9 +17,11 @@ from os import environ, makedirs
 from os.path import dirname, exists
 from subprocess import CompletedProcess, run
 from sys import version_info
-from typing import Any, Callable, Dict, Optional, TypeVar, Union, cast
+from typing import Any, Callable, Dict, Mapping, Optional, TypeVar, Union, cast
 
 from .consts import folder_mode
+from .metrics import register
+from .types import ExecutorOptions, Workload
 
 T = TypeVar("T")
 
@@ -27,10 +37,85 @@ class Void:
         return type(self).__name__
 
 
-async def run_in_executor(f: Callable[..., T], *args: Any, **kwargs: Any) -> T:
-    loop = get_running_loop()
+class Pool:
+    def __init__(self, workload: Workload, options: ExecutorOptions) -> None:
+        self.options = options
+        self.executor = ThreadPoolExecutor(
+            max_workers=options.workers, thread_name_prefix=f"chadtree_{workload.name}"
+        )
+        self._slots: Optional[Semaphore] = None
+        self.inflight = 0
+        self.peak = 0
+        self.throttled = 0
+        self.completed = 0
+
+    def slots(self) -> Semaphore:
+        if not self._slots:
+            self._slots = Semaphore(self.options.workers + self.options.queue)
+        return self._slots
+
+    def _release(self) -> None:
+        self.inflight -= 1
+        self.completed += 1
+        self.slots().release()
+
+    async def submit(self, cont: Callable[[], T]) -> T:
+        loop = get_running_loop()
+        slots = self.slots()
+        if slots.locked():
+            self.throttled += 1
+        await slots.acquire()
+        self.inflight += 1
+        self.peak = max(self.peak, self.inflight)
+
+        def done(_: Future) -> None:
+            loop.call_soon_threadsafe(self._release)
+
+        fut = self.executor.submit(cont)
+        fut.add_done_callback(done)
+        return await wrap_future(fut)
+
+    def stats(self) -> Mapping[str, int]:
+        workers = self.options.workers
+        return {
+            "workers": workers,
+            "running": min(self.inflight, workers),
+            "queued": max(self.inflight - workers, 0),
+            "peak": self.peak,
+            "throttled": self.throttled,
+            "completed": self.completed,
+        }
+
+
+DEFAULT_EXECUTOR = ExecutorOptions(workers=2, queue=8)
+_pools: Dict[Workload, Pool] = {}
+
+
+def configure_pools(executors: Mapping[Workload, ExecutorOptions]) -> None:
+    for workload, options in executors.items():
+        prev = _pools.get(workload)
+        if prev:
+            prev.executor.shutdown(wait=False)
+        _pools[workload] = Pool(workload, options=options)
+
+
+def pool_stats() -> Mapping[str, Mapping[str, int]]:
+    return {workload.name: pool.stats() for workload, pool in _pools.items()}
+
+
+register("pools", pool_stats)
+
+
+async def run_in_executor(
+    f: Callable[..., T],
+    *args: Any,
+    pool: Workload = Workload.metadata,
+    **kwargs: Any,
+) -> T:
+    if pool not in _pools:
+        _pools[pool] = Pool(pool, options=DEFAULT_EXECUTOR)
     cont = partial(f, *args, **kwargs)
-    return await loop.run_in_executor(None, cont)
+    return await _pools[pool].submit(cont)
 
 
 def or_else(thing: Union[T, Void], default: T) -> T:
@@ -86,10 +171,12 @@ class ProcReturn:
 
 if (version_info.major, version_info.minor) == (3, 7):
 
-    async def call(prog: str, *args: str, env: Dict[str, str] = {}) -> ProcReturn:
+    async def call(
+        prog: str, *args: str, env: Dict[str, str] = {}, cwd: Optional[str] = None
+    ) -> ProcReturn:
         def cont() -> CompletedProcess:
             envi = {**environ, **env}
-            return run((prog, *args), capture_output=True, env=envi)
+            return run((prog, *args), capture_output=True, env=envi, cwd=cwd)
 
         ret = await run_in_executor(cont)
         out, err = ret.stdout.decode(), ret.stderr.decode()
@@ -99,12 +186,19 @@ if (version_info.major, version_info.minor) == (3, 7):
 
 else:
 
-    async def call(prog: str, *args: str, env: Dict[str, str] = {}) -> ProcReturn:
+    async def call(
+        prog: str, *args: str, env: Dict[str, str] = {}, cwd: Optional[str] = None
+    ) -> ProcReturn:
         envi = {**environ, **env}
         proc = await create_subprocess_exec(
-            prog, *args, stdin=DEVNULL, stdout=PIPE, stderr=PIPE, env=envi
+            prog, *args, stdin=DEVNULL, stdout=PIPE, stderr=PIPE, env=envi, cwd=cwd
         )
-        stdout, stderr = await proc.communicate()
+        try:
+            stdout, stderr = await proc.communicate()
+        except CancelledError:
+            with suppress(ProcessLookupError):
+                proc.kill()
+            raise
         code = cast(int, proc.returncode)
         return ProcReturn(code=code, out=stdout.decode(), err=stderr.decode())
 
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+from threading import Lock
+from time import time_ns
+from typing import Dict, Mapping, Optional, Tuple
+
+from .types import Node
+
+RACY_NS = 2_000_000_000
+
+
+class DirCache:
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._lock = Lock()
+        self._entries: OrderedDict[str, Tuple[int, Dict[str, Node]]] = OrderedDict()
+        self.nodes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def fresh(self, path: str, mtime: int) -> bool:
+        with self._lock:
+            entry = self._entries.get(path)
+            return entry is not None and entry[0] == mtime
+
+    def get(self, path: str, mtime: int) -> Optional[Dict[str, Node]]:
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == mtime:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            else:
+                self._drop(path)
+                self.misses += 1
+                return None
+
+    def _drop(self, path: str) -> None:
+        entry = self._entries.pop(path, None)
+        if entry:
+            _, children = entry
+            self.nodes -= len(children)
+
+    def put(self, path: str, mtime: int, children: Dict[str, Node]) -> None:
+        if time_ns() - mtime < RACY_NS:
+            return
+        with self._lock:
+            self._drop(path)
+            self._entries[path] = mtime, children
+            self.nodes += len(children)
+            while self._entries and self.nodes > self.capacity:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+
+    def stats(self) -> Mapping[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "nodes": self.nodes,
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
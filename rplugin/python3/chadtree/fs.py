@@ -15,6 +15,7 @@ from typing import Dict, Iterable, Iterator, Optional, Set
 
 from .consts import file_mode, folder_mode
 from .da import run_in_executor
+from .types import Workload
 
 
 def ancestors(path: str) -> Iterator[str]:
@@ -42,7 +43,7 @@ async def fs_exists(path: str) -> bool:
     def cont() -> bool:
         return exists(path)
 
-    return await run_in_executor(cont)
+    return await run_in_executor(cont, pool=Workload.metadata)
 
 
 @dataclass(frozen=True)
@@ -104,7 +105,7 @@ async def fs_stat(path: str) -> FSstat:
     def cont() -> FSstat:
         return _fs_stat(path)
 
-    return await run_in_executor(cont)
+    return await run_in_executor(cont, pool=Workload.metadata)
 
 
 def _new(dest: str) -> None:
@@ -120,7 +121,7 @@ async def new(dest: str) -> None:
     def cont() -> None:
         _new(dest)
 
-    await run_in_executor(cont)
+    await run_in_executor(cont, pool=Workload.bulk)
 
 
 def _rename(src: str, dest: str) -> None:
@@ -133,7 +134,7 @@ async def rename(src: str, dest: str) -> None:
     def cont() -> None:
         _rename(src, dest)
 
-    await run_in_executor(cont)
+    await run_in_executor(cont, pool=Workload.bulk)
 
 
 def _remove(src: str) -> None:
@@ -149,7 +150,7 @@ async def remove(paths: Iterable[str]) -> None:
         for path in paths:
             _remove(path)
 
-    await run_in_executor(cont)
+    await run_in_executor(cont, pool=Workload.bulk)
 
 
 def _cut(src: str, dest: str) -> None:
@@ -161,7 +162,7 @@ async def cut(operations: Dict[str, str]) -> None:
         for src, dest in operations.items():
             _cut(src, dest)
 
-    await run_in_executor(cont)
+    await run_in_executor(cont, pool=Workload.bulk)
 
 
 def _copy(src: str, dest: str) -> None:
@@ -177,4 +178,4 @@ async def copy(operations: Dict[str, str]) -> None:
         for src, dest in operations.items():
             _copy(src, dest)
 
-    await run_in_executor(cont)
+    await run_in_executor(cont, pool=Workload.bulk)
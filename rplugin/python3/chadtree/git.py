@@ -1,33 +1,96 @@
-from asyncio import gather
+from asyncio import (
+    CancelledError,
+    Semaphore,
+    Task,
+    TimeoutError,
+    create_task,
+    current_task,
+    gather,
+    shield,
+    wait,
+    wait_for,
+)
+from functools import lru_cache, partial
 from locale import strxfrm
-from os import linesep
-from os.path import join, sep
+from os import environ, linesep
+from os.path import exists, expanduser, isdir, join, sep
+from pathlib import Path
 from shutil import which
-from typing import Dict, Iterator, Set, Tuple
+from typing import (
+    Any,
+    Callable,
+    Coroutine,
+    Dict,
+    Iterator,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    cast,
+)
 
-from .da import call
+from .consts import git_procs
+from .da import ProcReturn, call, run_in_executor
 from .fs import ancestors
-from .types import VCStatus
+from .gitignore import watch
+from .gitindex import Snapshot, find_top, observe, replay, settle
+from .logging import log
+from .metrics import incr
+from .tracing import traced
+from .types import Mode, Node, VCDelta, VCStatus, Workload
 
-GIT_LIST_CMD = ("git", "status", "--ignored", "--renames", "--porcelain")
+GIT_DIR = ".git"
+GIT_LIST_CMD = ("git", "status", "--renames", "--porcelain")
 GIT_SUBMODULE_MARKER = "Entering "
 GIT_ENV = {"LC_ALL": "C"}
+EXCLUDES_KEY = "core.excludesFile"
+
+_snapshots: Dict[str, Snapshot] = {}
+_tops: Dict[str, str] = {}
+_excludes: Dict[str, str] = {}
 
 
 class GitError(Exception):
     pass
 
 
-async def root() -> str:
-    ret = await call("git", "rev-parse", "--show-toplevel")
-    if ret.code != 0:
-        raise GitError(ret.err)
-    else:
-        return ret.out.rstrip()
+@lru_cache(maxsize=None)
+def _budget() -> Semaphore:
+    return Semaphore(git_procs)
+
+
+async def _call(
+    *args: str, cwd: Optional[str] = None, env: Dict[str, str] = {}
+) -> ProcReturn:
+    async with _budget():
+        incr("git.procs")
+        return await call(*args, cwd=cwd, env=env)
+
+
+async def excludes_file() -> str:
+    if EXCLUDES_KEY not in _excludes:
+        if which("git"):
+            ret = await _call("git", "config", "--path", EXCLUDES_KEY)
+            configured = expanduser(ret.out.strip()) if ret.code == 0 else ""
+        else:
+            configured = ""
+        xdg = environ.get("XDG_CONFIG_HOME", join(Path.home(), ".config"))
+        _excludes[EXCLUDES_KEY] = configured or join(xdg, "git", "ignore")
+    return _excludes[EXCLUDES_KEY]
+
+
+async def root(cwd: str) -> str:
+    if cwd not in _tops:
+        ret = await _call("git", "rev-parse", "--show-toplevel", cwd=cwd)
+        if ret.code != 0:
+            raise GitError(ret.err)
+        else:
+            _tops[cwd] = ret.out.rstrip()
+    return _tops[cwd]
 
 
-async def stat_main() -> Dict[str, str]:
-    ret = await call(*GIT_LIST_CMD, "-z")
+async def stat_main(cwd: str) -> Dict[str, str]:
+    ret = await _call(*GIT_LIST_CMD, "-z", cwd=cwd)
     if ret.code != 0:
         raise GitError(ret.err)
     else:
@@ -40,17 +103,18 @@ async def stat_main() -> Dict[str, str]:
                 if "R" in prefix:
                     next(it, None)
 
-        entries = {file: prefix for prefix, file in cont()}
+        entries = {file: prefix for prefix, file in cont() if file}
         return entries
 
 
-async def stat_sub_modules() -> Dict[str, str]:
-    ret = await call(
+async def stat_sub_modules(cwd: str) -> Dict[str, str]:
+    ret = await _call(
         "git",
         "submodule",
         "foreach",
         "--recursive",
         " ".join(GIT_LIST_CMD),
+        cwd=cwd,
         env=GIT_ENV,
     )
     if ret.code != 0:
@@ -65,7 +129,8 @@ async def stat_sub_modules() -> Dict[str, str]:
                     root = line[len(GIT_SUBMODULE_MARKER) + 1 : -1].rstrip(linesep)
                 else:
                     prefix, file = line[:2], line[3:]
-                    yield prefix, join(root, file.rstrip(sep))
+                    if file:
+                        yield prefix, join(root, file.rstrip(sep))
                     if "R" in prefix:
                         next(it, None)
 
@@ -73,35 +138,158 @@ async def stat_sub_modules() -> Dict[str, str]:
         return entries
 
 
-def parse(root: str, stats: Dict[str, str]) -> VCStatus:
-    ignored: Set[str] = set()
+def parse(stats: Dict[str, str]) -> VCStatus:
     status: Dict[str, str] = {}
     directories: Dict[str, Set[str]] = {}
 
-    for name, stat in stats.items():
-        path = join(root, name)
+    for path, stat in stats.items():
         status[path] = stat
-        if "!" in stat:
-            ignored.add(path)
-        else:
-            for ancestor in ancestors(path):
-                aggregate = directories.setdefault(ancestor, set())
-                aggregate.update(stat)
+        for ancestor in ancestors(path):
+            aggregate = directories.setdefault(ancestor, set())
+            aggregate.update(stat)
 
     for directory, syms in directories.items():
         symbols = sorted((s for s in syms if s != " "), key=strxfrm)
         status[directory] = "".join(symbols)
 
-    return VCStatus(ignored=ignored, status=status)
+    return VCStatus(status=status)
+
+
+def delta(prev: VCStatus, vc: VCStatus) -> VCDelta:
+    if prev.status == vc.status:
+        added: Set[str] = set()
+        removed: Set[str] = set()
+        changed: Set[str] = set()
+    else:
+        keys = prev.status.keys() ^ vc.status.keys()
+        added = keys - prev.status.keys()
+        removed = keys - added
+        changed = {
+            path
+            for path, _ in prev.status.items() ^ vc.status.items()
+            if path not in keys
+        }
+    ignored = set() if prev.ignored == vc.ignored else prev.ignored ^ vc.ignored
+    return VCDelta(added=added, removed=removed, changed=changed, ignored=ignored)
+
+
+def repos(root: Node) -> Sequence[str]:
+    def walk(node: Node, nested: bool) -> Iterator[str]:
+        git_dir = join(node.path, GIT_DIR)
+        if node.children is None:
+            is_repo = isdir(git_dir) or (not nested and exists(git_dir))
+        else:
+            child = node.children.get(git_dir)
+            is_repo = child is not None and (Mode.folder in child.mode or not nested)
+        if is_repo:
+            yield node.path
+        for child in (node.children or {}).values():
+            if Mode.folder in child.mode and child.path != git_dir:
+                yield from walk(child, nested=nested or is_repo)
+
+    top = find_top(root.path)
+    found = (top, *walk(root, nested=top is not None)) if top else walk(root, False)
+    return tuple(sorted({*found}, key=len))
+
+
+async def stat_index(top: str) -> Tuple[str, Dict[str, str]]:
+    snapshot = _snapshots.get(top)
+    excludes = await excludes_file()
+    observation = await run_in_executor(
+        observe,
+        top,
+        snapshot.untracked if snapshot else (),
+        partial(watch, excludes=excludes),
+        pool=Workload.scan,
+    )
+    stats = replay(snapshot, observation) if snapshot and observation else None
+    if stats is not None:
+        return top, stats
+    else:
+        r, s_main, s_sub = await gather(
+            root(top), stat_main(top), stat_sub_modules(top)
+        )
+        stats = {**s_sub, **s_main}
+        if observation and r == top:
+            _snapshots[r] = await run_in_executor(
+                settle, r, observation, stats, pool=Workload.scan
+            )
+        return r, stats
+
+
+async def _stat_repo(top: str) -> Dict[str, str]:
+    try:
+        r, stats = await stat_index(top)
+    except GitError:
+        return {}
+    else:
+        return {join(r, name): stat for name, stat in stats.items()}
 
 
-async def status() -> VCStatus:
+@traced
+async def _status(root: Node) -> VCStatus:
     if which("git"):
-        try:
-            r, s_main, s_sub = await gather(root(), stat_main(), stat_sub_modules())
-            stats = {**s_sub, **s_main}
-            return parse(r, stats)
-        except GitError:
-            return VCStatus()
+        tops = await run_in_executor(repos, root, pool=Workload.scan)
+        results = await gather(*map(_stat_repo, tops))
+        stats = {path: stat for result in results for path, stat in result.items()}
+        return parse(stats)
     else:
         return VCStatus()
+
+
+class SingleFlight:
+    def __init__(self, fn: Callable[[Node], Coroutine[Any, Any, VCStatus]]) -> None:
+        self._fn = fn
+        self._root: Optional[Node] = None
+        self._current: Optional[Task] = None
+        self._next: Optional[Task] = None
+        self._waiters: Dict[Task, int] = {}
+        self.last = VCStatus()
+
+    def _done(self, task: Task) -> None:
+        if not task.cancelled() and not task.exception():
+            self.last = task.result()
+
+    def _launch(self, root: Node) -> Task:
+        prev = self._current
+        self._root = root
+
+        async def follow() -> VCStatus:
+            try:
+                if prev:
+                    await wait((prev,))
+            finally:
+                if self._next is current_task():
+                    self._current, self._next = self._next, None
+            return await self._fn(cast(Node, self._root))
+
+        if self._next:
+            return self._next
+        elif prev and not prev.done():
+            task = self._next = create_task(follow())
+        else:
+            task = self._current = create_task(self._fn(root))
+        task.add_done_callback(self._done)
+        return task
+
+    async def __call__(self, root: Node, timeout: float) -> VCStatus:
+        task = self._launch(root)
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await wait_for(shield(task), timeout=timeout)
+        except TimeoutError:
+            log.warning("%s", f"git status took over {timeout}s, using last known")
+            if self._waiters[task] <= 1 and task is self._current and self._next:
+                task.cancel()
+            return self.last
+        except CancelledError:
+            if self._waiters[task] <= 1 and task is self._current and self._next:
+                task.cancel()
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                self._waiters.pop(task)
+
+
+status = SingleFlight(_status)
@@ -0,0 +1,291 @@
+from dataclasses import dataclass
+from os import scandir, stat
+from os.path import dirname, exists, isfile, join
+from re import Pattern, compile, escape
+from typing import (
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from .da import run_in_executor
+from .fs import ancestors
+from .gitindex import GitIndexError, read_index
+from .types import Mode, Node, Workload
+
+GIT_DIR = ".git"
+GIT_IGNORE = ".gitignore"
+
+
+@dataclass(frozen=True)
+class Rule:
+    pattern: Pattern
+    negate: bool
+    dir_only: bool
+
+
+@dataclass(frozen=True)
+class Matcher:
+    base: str
+    rules: Sequence[Rule]
+
+
+_matchers: Dict[str, Tuple[int, Optional[Matcher]]] = {}
+_tracked: Dict[str, Tuple[int, FrozenSet[str]]] = {}
+
+
+def _translate_segment(segment: str) -> Iterator[str]:
+    it = iter(segment)
+    for char in it:
+        if char == "*":
+            yield "[^/]*"
+        elif char == "?":
+            yield "[^/]"
+        elif char == "\\":
+            yield escape(next(it, "\\"))
+        elif char == "[":
+            chars: List[str] = []
+            for c in it:
+                if c == "]" and chars:
+                    break
+                chars.append(c)
+            else:
+                yield escape("[" + "".join(chars))
+                continue
+            head, *tail = chars
+            neg = "^" if head in {"!", "^"} else head.replace("\\", "\\\\")
+            body = "".join(tail).replace("\\", "\\\\")
+            yield f"[{neg}{body}]"
+        else:
+            yield escape(char)
+
+
+def _translate(pattern: str) -> str:
+    anchored = "/" in pattern
+    segments = pattern.lstrip("/").split("/")
+    last = len(segments) - 1
+
+    def cont() -> Iterator[str]:
+        if not anchored:
+            yield "(?:.*/)?"
+        for idx, segment in enumerate(segments):
+            if segment == "**":
+                yield ".*" if idx == last else "(?:.*/)?"
+            else:
+                yield from _translate_segment(segment)
+                if idx != last:
+                    yield "/"
+
+    return "".join(cont())
+
+
+def _parse_line(line: str) -> Optional[Rule]:
+    line = line.rstrip("\r\n")
+    while line.endswith(" ") and not line.endswith("\\ "):
+        line = line[:-1]
+    if not line or line.startswith("#"):
+        return None
+    else:
+        negate = line.startswith("!")
+        line = line[1:] if negate else line
+        line = line[1:] if line.startswith(("\\!", "\\#")) else line
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            return None
+        else:
+            pattern = compile(_translate(line) + r"\Z")
+            return Rule(pattern=pattern, negate=negate, dir_only=dir_only)
+
+
+def _matcher(path: str, base: str) -> Optional[Matcher]:
+    try:
+        mtime = stat(path).st_mtime_ns
+    except OSError:
+        _matchers.pop(path, None)
+        return None
+    else:
+        cached = _matchers.get(path)
+        if cached and cached[0] == mtime:
+            _, matcher = cached
+            return matcher
+        else:
+            with open(path, encoding="utf8", errors="replace") as fd:
+                rules = tuple(
+                    rule for rule in (_parse_line(line) for line in fd) if rule
+                )
+            matcher = Matcher(base=base, rules=rules) if rules else None
+            _matchers[path] = (mtime, matcher)
+            return matcher
+
+
+def _worktree_dir(top: str) -> str:
+    git_dir = join(top, GIT_DIR)
+    if isfile(git_dir):
+        with open(git_dir, encoding="utf8") as fd:
+            _, _, gd = fd.read().partition("gitdir:")
+        git_dir = join(top, gd.strip())
+    return git_dir
+
+
+def _git_dir(top: str) -> str:
+    git_dir = _worktree_dir(top)
+    common = join(git_dir, "commondir")
+    if isfile(common):
+        with open(common, encoding="utf8") as fd:
+            git_dir = join(git_dir, fd.read().strip())
+    return git_dir
+
+
+def _repo_matchers(top: str, excludes: str) -> Iterator[Matcher]:
+    info = join(_git_dir(top), "info", "exclude")
+    for path in (excludes, info):
+        matcher = _matcher(path, base=top) if path else None
+        if matcher:
+            yield matcher
+
+
+def _tracked_paths(top: str) -> FrozenSet[str]:
+    index = join(_worktree_dir(top), "index")
+    try:
+        mtime = stat(index).st_mtime_ns
+        cached = _tracked.get(top)
+        if cached and cached[0] == mtime:
+            _, tracked = cached
+        else:
+            paths: Set[str] = set()
+            for entry in read_index(index):
+                path = join(top, entry.path)
+                while path not in paths and path != top:
+                    paths.add(path)
+                    path = dirname(path)
+            tracked = frozenset(paths)
+            _tracked[top] = (mtime, tracked)
+    except (OSError, GitIndexError):
+        _tracked.pop(top, None)
+        return frozenset()
+    else:
+        return tracked
+
+
+def _top(path: str) -> Optional[str]:
+    lineage = (*ancestors(path), path)
+    return next((p for p in reversed(lineage) if exists(join(p, GIT_DIR))), None)
+
+
+def _context(path: str, excludes: str) -> Sequence[Matcher]:
+    lineage = (*ancestors(path), path)
+    top = _top(path)
+    if top is None or top == path:
+        return ()
+    else:
+
+        def cont() -> Iterator[Matcher]:
+            yield from _repo_matchers(top, excludes=excludes)
+            for directory in lineage[lineage.index(top) : -1]:
+                matcher = _matcher(join(directory, GIT_IGNORE), base=directory)
+                if matcher:
+                    yield matcher
+
+        return tuple(cont())
+
+
+def _is_ignored(matchers: Sequence[Matcher], path: str, is_dir: bool) -> bool:
+    for matcher in reversed(matchers):
+        rel = path[len(matcher.base) + 1 :]
+        for rule in reversed(matcher.rules):
+            if (is_dir or not rule.dir_only) and rule.pattern.match(rel):
+                return not rule.negate
+    return False
+
+
+def _ignored(root: Node, excludes: str) -> Set[str]:
+    ignored: Set[str] = set()
+
+    def walk(
+        node: Node,
+        matchers: Sequence[Matcher],
+        tracked: FrozenSet[str],
+        parent_excluded: bool,
+    ) -> None:
+        children = node.children or {}
+        if join(node.path, GIT_DIR) in children:
+            matchers = tuple(_repo_matchers(node.path, excludes=excludes))
+            tracked = _tracked_paths(node.path)
+        if join(node.path, GIT_IGNORE) in children:
+            matcher = _matcher(join(node.path, GIT_IGNORE), base=node.path)
+            matchers = (*matchers, matcher) if matcher else matchers
+
+        for child in children.values():
+            is_dir = Mode.folder in child.mode
+            excluded = parent_excluded or _is_ignored(matchers, child.path, is_dir)
+            if excluded and child.path not in tracked:
+                ignored.add(child.path)
+            if child.children is not None:
+                walk(
+                    child,
+                    matchers=matchers,
+                    tracked=tracked,
+                    parent_excluded=excluded,
+                )
+
+    top = _top(root.path)
+    walk(
+        root,
+        matchers=_context(root.path, excludes=excludes),
+        tracked=_tracked_paths(top) if top else frozenset(),
+        parent_excluded=False,
+    )
+    return ignored
+
+
+def _mtime(path: str) -> int:
+    try:
+        return stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def watch(top: str, excludes: str) -> Dict[str, int]:
+    info = join(_git_dir(top), "info", "exclude")
+    watched = {path: _mtime(path) for path in (excludes, info) if path}
+    tracked = _tracked_paths(top)
+
+    def walk(
+        directory: str, matchers: Sequence[Matcher], parent_excluded: bool
+    ) -> None:
+        watched[directory] = _mtime(directory)
+        with scandir(directory) as it:
+            entries = tuple(it)
+        if any(entry.name == GIT_IGNORE for entry in entries):
+            path = join(directory, GIT_IGNORE)
+            watched[path] = _mtime(path)
+            matcher = _matcher(path, base=directory)
+            matchers = (*matchers, matcher) if matcher else matchers
+
+        for entry in entries:
+            path = join(directory, entry.name)
+            if (
+                entry.name != GIT_DIR
+                and entry.is_dir(follow_symlinks=False)
+                and not exists(join(path, GIT_DIR))
+            ):
+                excluded = parent_excluded or _is_ignored(matchers, path, True)
+                if not excluded or path in tracked:
+                    walk(path, matchers=matchers, parent_excluded=excluded)
+
+    walk(
+        top,
+        matchers=tuple(_repo_matchers(top, excludes=excludes)),
+        parent_excluded=False,
+    )
+    return watched
+
+
+async def ignored(root: Node, excludes: str) -> Set[str]:
+    return await run_in_executor(_ignored, root, excludes, pool=Workload.scan)
@@ -0,0 +1,268 @@
+from dataclasses import dataclass
+from mmap import ACCESS_READ, mmap
+from os import fsdecode, listdir, lstat, stat
+from os.path import dirname, exists, isdir, join
+from stat import S_ISDIR
+from struct import Struct
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    Optional,
+    Set,
+    Tuple,
+)
+
+GIT_DIR = ".git"
+GIT_MODULES = ".gitmodules"
+
+HEADER = Struct(">4sII")
+ENTRY = Struct(">IIIIIIIIII20sH")
+EXTENDED = Struct(">H")
+
+SIGNATURE = b"DIRC"
+VERSIONS = {2, 3, 4}
+
+FLAG_ASSUME_VALID = 0x8000
+FLAG_EXTENDED = 0x4000
+FLAG_STAGE = 0x3000
+FLAG_SKIP_WORKTREE = 0x4000
+FLAG_INTENT_TO_ADD = 0x2000
+
+MODE_GITLINK = 0o160000
+MASK_32 = 0xFFFFFFFF
+
+StatSig = Tuple[int, int, int, int, int]
+
+
+class GitIndexError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class IndexEntry:
+    path: str
+    ctime: int
+    mtime: int
+    mtime_ns: int
+    ino: int
+    mode: int
+    size: int
+    stage: int
+    skip: bool
+
+
+@dataclass(frozen=True)
+class Observation:
+    index: Tuple[int, int]
+    head: Tuple[str, int, int]
+    dirs: Dict[str, int]
+    untracked: Dict[str, int]
+    changed: Dict[str, StatSig]
+    modified: FrozenSet[str]
+    deleted: FrozenSet[str]
+    needs_hash: bool
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    observation: Observation
+    untracked: Dict[str, int]
+    stats: Dict[str, str]
+
+
+def _varint(buf: mmap, pos: int) -> Tuple[int, int]:
+    c = buf[pos]
+    pos += 1
+    val = c & 0x7F
+    while c & 0x80:
+        c = buf[pos]
+        pos += 1
+        val = ((val + 1) << 7) | (c & 0x7F)
+    return val, pos
+
+
+def read_index(path: str) -> Iterator[IndexEntry]:
+    with open(path, "rb") as fd, mmap(fd.fileno(), 0, access=ACCESS_READ) as buf:
+        signature, version, count = HEADER.unpack_from(buf, 0)
+        if signature != SIGNATURE or version not in VERSIONS:
+            raise GitIndexError(f"unsupported index: {signature!r} v{version}")
+
+        pos = HEADER.size
+        prev = b""
+        for _ in range(count):
+            start = pos
+            (
+                ctime,
+                _,
+                mtime,
+                mtime_ns,
+                _,
+                ino,
+                mode,
+                _,
+                _,
+                size,
+                _,
+                flags,
+            ) = ENTRY.unpack_from(buf, pos)
+            pos += ENTRY.size
+            skip = bool(flags & FLAG_ASSUME_VALID)
+            if version >= 3 and flags & FLAG_EXTENDED:
+                (extended,) = EXTENDED.unpack_from(buf, pos)
+                pos += EXTENDED.size
+                skip = skip or bool(
+                    extended & (FLAG_SKIP_WORKTREE | FLAG_INTENT_TO_ADD)
+                )
+
+            if version == 4:
+                strip, pos = _varint(buf, pos)
+                end = buf.find(b"\0", pos)
+                name = prev[: len(prev) - strip] + buf[pos:end]
+                pos = end + 1
+            else:
+                end = buf.find(b"\0", pos)
+                name = buf[pos:end]
+                pos = start + ((end - start + 8) & ~7)
+
+            prev = name
+            yield IndexEntry(
+                path=fsdecode(name),
+                ctime=ctime,
+                mtime=mtime,
+                mtime_ns=mtime_ns,
+                ino=ino,
+                mode=mode,
+                size=size,
+                stage=(flags & FLAG_STAGE) >> 12,
+                skip=skip,
+            )
+
+
+def find_top(path: str) -> Optional[str]:
+    while True:
+        if exists(join(path, GIT_DIR)):
+            return path
+        parent = dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def _mtime(path: str) -> int:
+    try:
+        return stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def _head(git_dir: str) -> Tuple[str, int, int]:
+    with open(join(git_dir, "HEAD"), encoding="utf8") as fd:
+        head = fd.read().strip()
+    _, _, ref = head.partition("ref:")
+    ref_mtime = _mtime(join(git_dir, ref.strip())) if ref else 0
+    return head, ref_mtime, _mtime(join(git_dir, "packed-refs"))
+
+
+def _supported(top: str) -> bool:
+    git_dir = join(top, GIT_DIR)
+    return (
+        isdir(git_dir)
+        and not exists(join(top, GIT_MODULES))
+        and not any(name.startswith("sharedindex.") for name in listdir(git_dir))
+    )
+
+
+def observe(
+    top: str, untracked: Iterable[str], watch: Callable[[str], Dict[str, int]]
+) -> Optional[Observation]:
+    if not _supported(top):
+        return None
+    git_dir = join(top, GIT_DIR)
+    index_path = join(git_dir, "index")
+    try:
+        info = stat(index_path)
+        head = _head(git_dir)
+        watched = watch(top)
+        entries = read_index(index_path)
+
+        changed: Dict[str, StatSig] = {}
+        modified: Set[str] = set()
+        deleted: Set[str] = set()
+        needs_hash = False
+
+        for entry in entries:
+            racy = entry.mtime * 10 ** 9 + entry.mtime_ns >= info.st_mtime_ns
+            if entry.stage or racy:
+                needs_hash = True
+            if entry.skip or entry.mode & MODE_GITLINK == MODE_GITLINK:
+                continue
+
+            path = join(top, entry.path)
+            try:
+                st = lstat(path)
+            except FileNotFoundError:
+                deleted.add(entry.path)
+                continue
+
+            sig = (
+                int(st.st_ctime) & MASK_32,
+                int(st.st_mtime) & MASK_32,
+                st.st_mtime_ns % 10 ** 9,
+                st.st_ino & MASK_32,
+                st.st_size & MASK_32,
+            )
+            if sig != (entry.ctime, entry.mtime, entry.mtime_ns, entry.ino, entry.size):
+                changed[entry.path] = sig
+                if sig[-1] != entry.size and not S_ISDIR(st.st_mode):
+                    modified.add(entry.path)
+    except (OSError, GitIndexError):
+        return None
+    else:
+        return Observation(
+            index=(info.st_mtime_ns, info.st_size),
+            head=head,
+            dirs=watched,
+            untracked={d: _mtime(d) for d in untracked},
+            changed=changed,
+            modified=frozenset(modified),
+            deleted=frozenset(deleted),
+            needs_hash=needs_hash,
+        )
+
+
+def settle(top: str, observation: Observation, stats: Dict[str, str]) -> Snapshot:
+    untracked = {
+        path: _mtime(path)
+        for path in (join(top, name) for name, stat in stats.items() if stat == "??")
+        if isdir(path)
+    }
+    return Snapshot(observation=observation, untracked=untracked, stats=stats)
+
+
+def replay(snapshot: Snapshot, observation: Observation) -> Optional[Dict[str, str]]:
+    prev = snapshot.observation
+    if (
+        observation.needs_hash
+        or observation.index != prev.index
+        or observation.head != prev.head
+        or observation.dirs != prev.dirs
+        or observation.untracked != snapshot.untracked
+        or not prev.changed.keys() <= observation.changed.keys()
+        or observation.deleted != prev.deleted
+    ):
+        return None
+
+    stats = {**snapshot.stats}
+    for path, sig in observation.changed.items():
+        if prev.changed.get(path) == sig:
+            continue
+        elif path in observation.modified:
+            staged = stats.get(path, "  ")[0]
+            stats[path] = f"{staged}M"
+        else:
+            return None
+
+    return stats
@@ -1,11 +1,18 @@
-from itertools import repeat
-from typing import Dict, Iterator, Set, Tuple
-from uuid import uuid4
-
-from pynvim import Nvim
+from hashlib import blake2b
+from typing import (
+    AbstractSet,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
 from .consts import fm_hl_prefix
-from .nvim import atomic, call
+from .metrics import register
 from .types import HLgroup
 
 LEGAL_CTERM: Set[str] = {
@@ -20,31 +27,62 @@ LEGAL_CTERM: Set[str] = {
 
 LEGAL_CTERM_COLOURS = range(8)
 
+_defined: Set[str] = set()
+_pending: Set[str] = set()
+
+
+def new_hl(
+    *,
+    cterm: AbstractSet[str] = frozenset(),
+    ctermfg: Optional[str] = None,
+    ctermbg: Optional[str] = None,
+    guifg: Optional[str] = None,
+    guibg: Optional[str] = None,
+) -> HLgroup:
+    key = repr((sorted(cterm), ctermfg, ctermbg, guifg, guibg))
+    digest = blake2b(key.encode(), digest_size=8).hexdigest()
+    group = HLgroup(
+        name=f"{fm_hl_prefix}_{digest}",
+        cterm={*cterm},
+        ctermfg=ctermfg,
+        ctermbg=ctermbg,
+        guifg=guifg,
+        guibg=guibg,
+    )
+    return group
+
+
+def gen_hl(mapping: Dict[str, str]) -> Dict[str, HLgroup]:
+    return {key: new_hl(guifg=val) for key, val in mapping.items()}
+
+
+def hl_command(group: HLgroup) -> str:
+    name = group.name
+    _cterm = ",".join(group.cterm) or "NONE"
+    cterm = f"cterm={_cterm}"
+    ctermfg = f"ctermfg={group.ctermfg}" if group.ctermfg else ""
+    ctermbg = f"ctermbg={group.ctermbg}" if group.ctermbg else ""
+    guifg = f"guifg={group.guifg}" if group.guifg else ""
+    guibg = f"guibg={group.guibg}" if group.guibg else ""
+
+    return f"highlight {name} {cterm} {ctermfg} {ctermbg} {guifg} {guibg}"
+
 
-def gen_hl(name_prefix: str, mapping: Dict[str, str]) -> Dict[str, HLgroup]:
-    def cont() -> Iterator[Tuple[str, HLgroup]]:
-        for key, val in mapping.items():
-            name = f"{fm_hl_prefix}_{name_prefix}_{uuid4().hex}"
-            yield key, HLgroup(name=name, guifg=val)
+def define_hl(groups: Iterable[HLgroup]) -> Iterator[Tuple[str, Sequence[Any]]]:
+    for group in groups:
+        if group.name not in _defined and group.name not in _pending:
+            _pending.add(group.name)
+            yield "command", (hl_command(group),)
 
-    return {k: v for k, v in cont()}
 
+def commit_hl(success: bool) -> None:
+    if success:
+        _defined.update(_pending)
+    _pending.clear()
 
-async def add_hl_groups(nvim: Nvim, groups: Iterator[HLgroup]) -> None:
-    def parse() -> Iterator[Tuple[str]]:
-        for group in groups:
-            name = group.name
-            _cterm = ",".join(group.cterm) or "NONE"
-            cterm = f"cterm={_cterm}"
-            ctermfg = f"ctermfg={group.ctermfg}" if group.ctermfg else ""
-            ctermbg = f"ctermbg={group.ctermbg}" if group.ctermbg else ""
-            guifg = f"guifg={group.guifg}" if group.guifg else ""
-            guibg = f"guibg={group.guibg}" if group.guibg else ""
 
-            yield (f"highlight {name} {cterm} {ctermfg} {ctermbg} {guifg} {guibg}",)
+def hl_stats() -> Dict[str, int]:
+    return {"defined": len(_defined)}
 
-    def cont() -> None:
-        commands = zip(repeat("command"), parse())
-        atomic(nvim, *commands)
 
-    await call(nvim, cont)
+register("highlights", hl_stats)
@@ -0,0 +1,19 @@
+from importlib.util import LazyLoader, find_spec, module_from_spec
+from sys import modules
+from types import ModuleType
+
+
+def lazy(name: str) -> ModuleType:
+    loaded = modules.get(name)
+    if loaded:
+        return loaded
+    else:
+        spec = find_spec(name)
+        if not spec or not spec.loader:
+            raise ModuleNotFoundError(name)
+        loader = LazyLoader(spec.loader)
+        spec.loader = loader
+        module = module_from_spec(spec)
+        modules[name] = module
+        loader.exec_module(module)
+        return module
@@ -3,9 +3,8 @@ from enum import Enum, IntEnum, auto
 from itertools import chain, repeat
 from os import environ
 from typing import Callable, Dict, Iterator, Optional, Set, Tuple, Union, cast
-from uuid import uuid4
 
-from .consts import fm_hl_prefix
+from .highlight import new_hl
 from .types import Colours, HLcontext, HLgroup, Mode
 
 
@@ -219,7 +218,6 @@ def parse_styling(codes: str) -> Styling:
 def parseHLGroup(styling: Styling, colours: Colours) -> HLgroup:
     bit8_mapping = colours.bit8_mapping
     fg, bg = styling.foreground, styling.background
-    name = f"{fm_hl_prefix}_ls_{uuid4().hex}"
     cterm = {
         style
         for style in (HL_STYLE_TABLE.get(style) for style in styling.styles)
@@ -239,8 +237,7 @@ def parseHLGroup(styling: Styling, colours: Colours) -> HLgroup:
         if type(bg) is Colour
         else (ansibg.hl24 if ansibg else None)
     )
-    group = HLgroup(
-        name=name,
+    group = new_hl(
         cterm=cterm,
         ctermfg=ctermfg,
         ctermbg=ctermbg,
@@ -258,8 +255,6 @@ def parse_ls_colours(colours: Colours) -> HLcontext:
             segment.partition("=") for segment in ls_colours.strip(":").split(":")
         )
     }
-    groups = tuple(hl_lookup.values())
-
     mode_lookup_pre: Dict[Mode, HLgroup] = {
         k: v
         for k, v in ((v, hl_lookup.pop(k, None)) for k, v in SPECIAL_PRE_TABLE.items())
@@ -278,7 +273,6 @@ def parse_ls_colours(colours: Colours) -> HLcontext:
     ext_lookup: Dict[str, HLgroup] = {key[1:]: hl_lookup.pop(key) for key in ext_keys}
 
     context = HLcontext(
-        groups=groups,
         mode_lookup_pre=mode_lookup_pre,
         mode_lookup_post=mode_lookup_post,
         ext_lookup=ext_lookup,
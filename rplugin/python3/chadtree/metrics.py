@@ -0,0 +1,84 @@
+from collections import deque
+from threading import Lock
+from typing import Any, Callable, Counter, Deque, Dict, Iterator, Mapping
+
+WINDOW = 1024
+
+_lock = Lock()
+_counters: Counter[str] = Counter()
+_histograms: Dict[str, "Histogram"] = {}
+_gauges: Dict[str, Callable[[], Mapping[str, Any]]] = {}
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent: Deque[float] = deque(maxlen=WINDOW)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.recent.append(value)
+
+    def stats(self) -> Mapping[str, float]:
+        recent = sorted(self.recent)
+
+        def pct(p: float) -> float:
+            return recent[min(int(len(recent) * p), len(recent) - 1)] if recent else 0
+
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0,
+            "p50": pct(0.5),
+            "p90": pct(0.9),
+            "p99": pct(0.99),
+            "max": self.max,
+        }
+
+
+def incr(name: str, value: int = 1) -> None:
+    with _lock:
+        _counters[name] += value
+
+
+def counter(name: str) -> int:
+    with _lock:
+        return _counters[name]
+
+
+def observe(name: str, value: float) -> None:
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(value)
+
+
+def register(name: str, gauge: Callable[[], Mapping[str, Any]]) -> None:
+    _gauges[name] = gauge
+
+
+def snapshot() -> Mapping[str, Any]:
+    with _lock:
+        counters = dict(_counters)
+        histograms = {name: h.stats() for name, h in _histograms.items()}
+    gauges = {name: gauge() for name, gauge in _gauges.items()}
+    return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+
+def pretty(stats: Mapping[str, Any], depth: int = 0) -> str:
+    def cont() -> Iterator[str]:
+        for key, val in sorted(stats.items()):
+            indent = "  " * depth
+            if isinstance(val, Mapping):
+                yield f"{indent}{key}"
+                yield pretty(val, depth=depth + 1)
+            elif isinstance(val, float):
+                yield f"{indent}{key}: {val:.3f}"
+            else:
+                yield f"{indent}{key}: {val}"
+
+    return "\n".join(line for line in cont() if line)
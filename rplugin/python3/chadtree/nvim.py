@@ -1,19 +1,34 @@
 from asyncio import Future, Task, create_task, sleep
+from hashlib import sha1
 from itertools import repeat
 from os import linesep
 from typing import Any, Awaitable, Callable, Iterable, Sequence, Tuple, TypeVar
-from uuid import uuid4
 
 from pynvim import Nvim
 from pynvim.api.common import NvimError
 
 from .logging import log
+from .metrics import incr
+from .tracing import traced
 
 T = TypeVar("T")
 
 
+def instrument(nvim: Nvim) -> None:
+    session = nvim._session
+    request = session.request
+
+    def cont(name: str, *args: Any, **kwargs: Any) -> Any:
+        incr("rpc.calls")
+        return request(name, *args, **kwargs)
+
+    session.request = cont
+
+
+@traced
 def atomic(nvim: Nvim, *instructions: Tuple[str, Sequence[Any]]) -> Sequence[Any]:
     inst = tuple((f"nvim_{instruction}", args) for instruction, args in instructions)
+    incr("rpc.instructions", len(inst))
     out, err = nvim.api.call_atomic(inst)
     if err:
         raise NvimError(err)
@@ -24,12 +39,16 @@ def call(nvim: Nvim, fn: Callable[[], T]) -> Awaitable[T]:
     fut: Future = Future()
 
     def cont() -> None:
+        if fut.cancelled():
+            return
         try:
             ret = fn()
         except Exception as e:
-            fut.set_exception(e)
+            if not fut.done():
+                fut.set_exception(e)
         else:
-            fut.set_result(ret)
+            if not fut.done():
+                fut.set_result(ret)
 
     nvim.async_call(cont)
     return fut
@@ -77,14 +96,16 @@ async def autocmd(
     filters: Iterable[str] = ("*",),
     modifiers: Iterable[str] = (),
     arg_eval: Iterable[str] = (),
+    prelude: Iterable[str] = (),
 ) -> None:
     _events = ",".join(events)
     _filters = " ".join(filters)
     _modifiers = " ".join(modifiers)
     _args = ", ".join(arg_eval)
-    group = f"augroup {uuid4().hex}"
+    _call = " | ".join((*prelude, f"call {fn}({_args})"))
+    cmd = f"autocmd {_events} {_filters} {_modifiers} {_call}"
+    group = f"augroup chadtree_{sha1(cmd.encode()).hexdigest()}"
     cls = "autocmd!"
-    cmd = f"autocmd {_events} {_filters} {_modifiers} call {fn}({_args})"
     group_end = "augroup END"
 
     def cont() -> None:
@@ -0,0 +1,59 @@
+from asyncio import CancelledError, Future, Task, current_task, get_running_loop
+from contextlib import asynccontextmanager
+from heapq import heappop, heappush
+from itertools import count
+from typing import AsyncIterator, List, Mapping, Optional, Tuple
+
+from .types import Priority
+
+
+class PriorityLock:
+    def __init__(self) -> None:
+        self._seq = count()
+        self._queue: List[Tuple[Priority, int, Future]] = []
+        self._holder: Optional[Tuple[Priority, Optional[Task]]] = None
+        self.preempted = 0
+
+    def _preempt(self) -> None:
+        if self._holder and self._queue:
+            held, task = self._holder
+            waiting, _, _ = self._queue[0]
+            if task and held is Priority.background and waiting < held:
+                if task.cancel():
+                    self.preempted += 1
+
+    def _release(self) -> None:
+        self._holder = None
+        while self._queue:
+            priority, _, fut = heappop(self._queue)
+            if not fut.done():
+                self._holder = priority, None
+                fut.set_result(None)
+                break
+
+    def stats(self) -> Mapping[str, int]:
+        waiting = {priority.name: 0 for priority in Priority}
+        for priority, _, fut in self._queue:
+            if not fut.done():
+                waiting[priority.name] += 1
+        return {**waiting, "held": int(bool(self._holder)), "preempted": self.preempted}
+
+    @asynccontextmanager
+    async def acquire(self, priority: Priority) -> AsyncIterator[None]:
+        if self._holder or self._queue:
+            fut = get_running_loop().create_future()
+            heappush(self._queue, (priority, next(self._seq), fut))
+            self._preempt()
+            try:
+                await fut
+            except CancelledError:
+                if fut.done() and not fut.cancelled():
+                    self._release()
+                raise
+
+        self._holder = priority, current_task()
+        self._preempt()
+        try:
+            yield None
+        finally:
+            self._release()
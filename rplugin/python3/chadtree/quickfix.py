@@ -1,32 +1,92 @@
-from asyncio import gather
-from collections import Counter, defaultdict
-from itertools import chain
-from os.path import join
-from typing import Iterator, Sequence
+from bisect import bisect_left
+from collections import Counter
+from itertools import accumulate
+from os.path import join, sep
+from typing import Any, Dict, Iterator, Mapping, Sequence, Set, Tuple
 
 from pynvim import Nvim
 
 from .fs import ancestors
-from .nvim import call, getcwd
+from .metrics import incr, observe
+from .nvim import atomic, call
 from .types import QuickFix
 
+_QF_STAMP = "getqflist({'id': 0, 'changedtick': 0})"
+_QF_BUFS = "map(filter(getqflist(), {_, q -> q.bufnr > 0}), {_, q -> q.bufnr})"
+_QF_NAMES = f"map(uniq(sort({_QF_BUFS}, 'n')), {{_, b -> [b, bufname(b)]}})"
+_MAX_CHAR = chr(0x10FFFF)
+
+_last: Dict[Tuple[str, int, int], QuickFix] = {}
+
+
+class Locations(Mapping[str, int]):
+    def __init__(self, files: Mapping[str, int]) -> None:
+        self._files = files
+        self._paths = sorted(files)
+        self._sums = (0, *accumulate(files[path] for path in self._paths))
+        self._memo: Dict[str, int] = {}
+
+    def _count(self, path: str) -> int:
+        if path not in self._memo:
+            prefix = path if path.endswith(sep) else path + sep
+            lo = bisect_left(self._paths, prefix)
+            hi = bisect_left(self._paths, prefix + _MAX_CHAR, lo)
+            nested = self._sums[hi] - self._sums[lo]
+            self._memo[path] = self._files.get(path, 0) + nested
+        return self._memo[path]
+
+    def __getitem__(self, path: str) -> int:
+        count = self._count(path)
+        if count:
+            return count
+        else:
+            raise KeyError(path)
+
+    def __iter__(self) -> Iterator[str]:
+        seen: Set[str] = set()
+        for path in self._paths:
+            for step in (*ancestors(path), path):
+                if step not in seen:
+                    seen.add(step)
+                    yield step
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Locations):
+            return self._files == other._files
+        else:
+            return super().__eq__(other)
+
+    __hash__ = None  # type: ignore
+
 
 async def quickfix(nvim: Nvim) -> QuickFix:
-    def cont() -> Sequence[str]:
-        ql = nvim.funcs.getqflist()
-
-        def c() -> Iterator[str]:
-            for q in ql:
-                bufnr = q["bufnr"]
-                filename = nvim.funcs.bufname(bufnr)
-                yield filename
-
-        return tuple(c())
-
-    cwd, filenames = await gather(getcwd(nvim), call(nvim, cont))
-    full_names = tuple(join(cwd, filename) for filename in filenames)
-    parents = (ancestor for fullname in full_names for ancestor in ancestors(fullname))
-    count = Counter(chain(full_names, parents))
-    locations = defaultdict(int, count)
-    qf = QuickFix(locations=locations)
+    def stamp() -> Tuple[str, int, int]:
+        cwd, info = atomic(
+            nvim, ("call_function", ("getcwd", ())), ("eval", (_QF_STAMP,))
+        )
+        return cwd, info["id"], info["changedtick"]
+
+    def cont() -> Tuple[Sequence[int], Sequence[Tuple[int, str]]]:
+        bufs, names = atomic(nvim, ("eval", (_QF_BUFS,)), ("eval", (_QF_NAMES,)))
+        return bufs, names
+
+    key = await call(nvim, stamp)
+    if key in _last:
+        incr("quickfix.unchanged")
+        return _last[key]
+
+    cwd, _, _ = key
+    bufs, names = await call(nvim, cont)
+    lookup = {bufnr: join(cwd, name) for bufnr, name in names}
+    files: Dict[str, int] = Counter()
+    for bufnr, count in Counter(bufs).items():
+        files[lookup[bufnr]] += count
+    qf = QuickFix(locations=Locations(files))
+    incr("quickfix.rebuilt")
+    observe("quickfix.entries", len(bufs))
+    _last.clear()
+    _last[key] = qf
     return qf
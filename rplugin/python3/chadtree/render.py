@@ -2,10 +2,22 @@ from enum import IntEnum, auto
 from fnmatch import fnmatch
 from locale import strxfrm
 from os import linesep
-from os.path import sep
-from typing import Any, Callable, Iterator, Optional, Sequence, Tuple, cast
+from os.path import relpath, sep
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+    cast,
+)
 
 from .da import constantly
+from .metrics import observe
+from .tracing import traced
 from .types import (
     Badge,
     FilterPattern,
@@ -143,8 +155,8 @@ def paint(
             yield icons.link
 
     def gen_badges(path: str) -> Iterator[Badge]:
-        qf_count = qf.locations[path]
-        stat = vc.status.get(path)
+        qf_count = qf.locations.get(path, 0)
+        stat = vc.status.get(path) or ("!!" if path in vc.ignored else None)
         if qf_count:
             yield Badge(text=f"({qf_count})", group=icons.quickfix_hl)
         if stat:
@@ -157,13 +169,13 @@ def paint(
         end = begin + len(icon.encode())
         group = icon_lookup.get(node.ext or "")
         if group:
-            hl = Highlight(group=group.name, begin=begin, end=end)
+            hl = Highlight(group=group, begin=begin, end=end)
             yield hl
         group = search_hl(node)
         if group:
             begin = end
             end = len(name.encode()) + begin
-            hl = Highlight(group=group.name, begin=begin, end=end)
+            hl = Highlight(group=group, begin=begin, end=end)
             yield hl
 
     def show(node: Node, depth: int) -> Render:
@@ -181,6 +193,7 @@ def paint(
     return show
 
 
+@traced
 def render(
     node: Node,
     *,
@@ -219,4 +232,35 @@ def render(
         yield from iter(children)
 
     lookup, rendered = zip(*render(node, depth=0, cleared=False))
+    observe("render.nodes", len(lookup))
     return cast(Sequence[Node], lookup), cast(Sequence[Render], rendered)
+
+
+@traced
+def repaint(
+    root: Node,
+    *,
+    settings: Settings,
+    index: Index,
+    selection: Selection,
+    qf: QuickFix,
+    vc: VCStatus,
+    current: Optional[str],
+    lookup: Sequence[Node],
+    paths_lookup: Dict[str, int],
+    rendered: Sequence[Render],
+    paths: Iterable[str],
+) -> Sequence[Render]:
+    show = paint(
+        settings, index=index, selection=selection, qf=qf, vc=vc, current=current
+    )
+    repainted = [*rendered]
+    rows = 0
+    for path in paths:
+        row = paths_lookup.get(path)
+        if row is not None:
+            depth = 0 if path == root.path else relpath(path, root.path).count(sep) + 1
+            repainted[row] = show(lookup[row], depth)
+            rows += 1
+    observe("repaint.nodes", rows)
+    return repainted
@@ -1,25 +1,81 @@
-from asyncio import FIRST_COMPLETED, Event, gather, sleep, wait
-from time import time
-from typing import AsyncIterator
-
-
-async def schedule(
-    chan: Event, min_time: float, max_time: float
-) -> AsyncIterator[float]:
-    async def wheel() -> float:
-        t1 = time()
-        done, pending = await wait(
-            (chan.wait(), sleep(max_time)), return_when=FIRST_COMPLETED
-        )
-        chan.clear()
-        for p in pending:
-            p.cancel()
-        await gather(*done)
-        t2 = time()
-        elapsed = t2 - t1
-        await sleep(min_time - elapsed)
-        return time() - t1
-
-    while True:
-        t = await wheel()
-        yield t
+from asyncio import FIRST_COMPLETED, Event, create_task, sleep, wait
+from time import monotonic
+from typing import AsyncIterator, Mapping, Tuple
+
+from .logging import log
+from .types import UpdateTime
+
+BOOST_TICKS = 3
+MAX_BACKOFF_EXP = 16
+
+
+class Scheduler:
+    def __init__(self, chan: Event, update: UpdateTime) -> None:
+        self._chan = chan
+        self._update = update
+        self._cost = 0.0
+        self._idle = 0
+        self._boost = 0
+        self.waiting = False
+
+    def report(self, cost: float, changed: bool) -> None:
+        self._cost = cost if not self._cost else (self._cost + cost) / 2
+        if changed:
+            self._idle = 0
+        else:
+            self._idle += 1
+
+    def _interval(self) -> Tuple[float, str]:
+        update = self._update
+        floor = self._cost / update.duty_cycle if update.duty_cycle else 0
+        if self._boost:
+            interval, reason = update.min_time, "activity"
+        elif self._idle:
+            backoff = update.max_time * 2 ** min(self._idle, MAX_BACKOFF_EXP)
+            interval, reason = min(backoff, update.idle_time), f"idle x{self._idle}"
+        else:
+            interval, reason = update.max_time, "changed"
+
+        if floor > interval:
+            return floor, f"duty cycle, refresh took {self._cost:.3f}s"
+        else:
+            return max(interval, update.min_time), reason
+
+    def stats(self) -> Mapping[str, float]:
+        interval, _ = self._interval()
+        return {
+            "cost": self._cost,
+            "idle": self._idle,
+            "boost": self._boost,
+            "interval": interval,
+        }
+
+    async def _wheel(self) -> None:
+        interval, reason = self._interval()
+        log.debug("%s", f"next refresh in {interval:.3f}s :: {reason}")
+
+        t1 = monotonic()
+        signal = create_task(self._chan.wait())
+        self.waiting = True
+        try:
+            done, _ = await wait(
+                (signal,), timeout=interval, return_when=FIRST_COMPLETED
+            )
+        finally:
+            self.waiting = False
+            signal.cancel()
+        self._chan.clear()
+
+        if done:
+            self._boost = BOOST_TICKS
+            self._idle = 0
+        else:
+            self._boost = max(self._boost - 1, 0)
+
+        floor, _ = self._interval()
+        await sleep(floor - (monotonic() - t1))
+
+    async def ticks(self) -> AsyncIterator[None]:
+        while True:
+            await self._wheel()
+            yield None
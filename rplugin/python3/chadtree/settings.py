@@ -1,11 +1,20 @@
-from typing import Any, Dict, cast
+from contextlib import suppress
+from hashlib import sha1
+from json import dumps
+from os import environ, getpid, makedirs, replace, stat
+from os.path import dirname, join
+from pickle import HIGHEST_PROTOCOL, dump, load
+from sys import version_info
+from typing import Any, Dict, Optional, cast
 
 from .consts import (
     colours_json,
     config_json,
     custom_colours_json,
+    folder_mode,
     icon_lookup,
     ignore_json,
+    session_dir,
     view_json,
 )
 from .da import load_json, merge
@@ -14,17 +23,91 @@ from .ls_colours import parse_ls_colours
 from .types import (
     ColourMapping,
     Colours,
+    ExecutorOptions,
     MimetypeOptions,
+    PrefetchOptions,
     Settings,
     Sortby,
     UpdateTime,
     VersionControlOptions,
     ViewOptions,
+    Workload,
 )
 
 
+_SOURCES = (
+    config_json,
+    view_json,
+    ignore_json,
+    colours_json,
+    custom_colours_json,
+    *icon_lookup.values(),
+    *(
+        join(dirname(__file__), f"{module}.py")
+        for module in ("consts", "da", "highlight", "ls_colours", "settings", "types")
+    ),
+)
+_CACHE = join(session_dir, "settings.pickle")
+
+
+def _cache_key(*user: Any) -> str:
+    def mtime(path: str) -> Optional[int]:
+        try:
+            return stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    key = dumps(
+        (
+            tuple(version_info),
+            tuple(mtime(path) for path in _SOURCES),
+            user,
+            sha1(environ.get("LS_COLORS", "").encode()).hexdigest(),
+        ),
+        sort_keys=True,
+        default=repr,
+    )
+    return sha1(key.encode()).hexdigest()
+
+
+def _load_cache(key: str) -> Optional[Settings]:
+    with suppress(Exception):
+        with open(_CACHE, "rb") as fd:
+            cached_key, settings = load(fd)
+        if cached_key == key and isinstance(settings, Settings):
+            return settings
+    return None
+
+
+def _dump_cache(key: str, settings: Settings) -> None:
+    with suppress(OSError):
+        makedirs(dirname(_CACHE), mode=folder_mode, exist_ok=True)
+        tmp = f"{_CACHE}.{getpid()}"
+        with open(tmp, "wb") as fd:
+            dump((key, settings), fd, protocol=HIGHEST_PROTOCOL)
+        replace(tmp, _CACHE)
+
+
 def initial(
     user_config: Any, user_view: Any, user_ignores: Any, user_colours: Any
+) -> Settings:
+    key = _cache_key(user_config, user_view, user_ignores, user_colours)
+    cached = _load_cache(key)
+    if cached:
+        return cached
+    else:
+        settings = _compile(
+            user_config=user_config,
+            user_view=user_view,
+            user_ignores=user_ignores,
+            user_colours=user_colours,
+        )
+        _dump_cache(key, settings)
+        return settings
+
+
+def _compile(
+    user_config: Any, user_view: Any, user_ignores: Any, user_colours: Any
 ) -> Settings:
     config = merge(load_json(config_json), user_config, replace=True)
     view = merge(load_json(view_json), user_view, replace=True)
@@ -40,7 +123,7 @@ def initial(
         key: ColourMapping(hl8=val["hl8"], hl24=val["hl24"])
         for key, val in colours_c["8_bit"].items()
     }
-    ext_colours = gen_hl("github", mapping=github_colours)
+    ext_colours = gen_hl(github_colours)
     colours = Colours(bit8_mapping=bit8_mapping, exts=ext_colours)
     icons = ViewOptions(
         active=icon_c["status"]["active"],
@@ -60,12 +143,17 @@ def initial(
     )
 
     update = UpdateTime(
-        min_time=config["update_time"]["min"], max_time=config["update_time"]["max"]
+        min_time=config["update_time"]["min"],
+        max_time=config["update_time"]["max"],
+        idle_time=config["update_time"]["idle"],
+        duty_cycle=config["update_time"]["duty_cycle"],
+        frame_time=config["update_time"]["frame"],
     )
 
     version_ctl = VersionControlOptions(
         defer=config["version_control"]["defer"],
         enable=config["version_control"]["enable"],
+        timeout=config["version_control"]["timeout"],
     )
     hl_context = parse_ls_colours(colours)
 
@@ -75,8 +163,20 @@ def initial(
         ignore_exts={*config["mimetypes"]["ignore_exts"]},
     )
 
+    prefetch = PrefetchOptions(
+        enable=config["prefetch"]["enable"],
+        rows=config["prefetch"]["rows"],
+    )
+
+    executors = {
+        Workload[name]: ExecutorOptions(workers=opts["workers"], queue=opts["queue"])
+        for name, opts in config["executors"].items()
+    }
+
     sortby = tuple(Sortby[sb] for sb in config["sort_by"])
     settings = Settings(
+        cache_nodes=config["cache"]["nodes"],
+        executors=executors,
         follow=config["follow"],
         hl_context=hl_context,
         icons=icons,
@@ -86,6 +186,7 @@ def initial(
         name_ignore=ignore["name"],
         open_left=config["open_left"],
         path_ignore=ignore["path"],
+        prefetch=prefetch,
         session=config["session"],
         show_hidden=config["show_hidden"],
         sort_by=sortby,
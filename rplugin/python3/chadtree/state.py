@@ -1,4 +1,3 @@
-from asyncio import gather
 from hashlib import sha1
 from os.path import join
 from typing import Optional, Set, Union, cast
@@ -7,11 +6,12 @@ from pynvim import Nvim
 
 from .cartographer import new, update
 from .consts import session_dir
-from .da import Void, dump_json, load_json, or_else
-from .git import status
+from .da import Void, dump_json, load_json, or_else, run_in_executor
+from .git import delta, excludes_file
+from .gitignore import ignored
 from .nvim import getcwd
-from .quickfix import quickfix
-from .render import render
+from .render import render, repaint
+from .tracing import traced
 from .types import (
     FilterPattern,
     Index,
@@ -23,6 +23,7 @@ from .types import (
     Settings,
     State,
     VCStatus,
+    Workload,
 )
 
 
@@ -50,6 +51,16 @@ def load_session(cwd: str) -> Session:
         return nil_session
 
 
+async def _vc_ignored(root: Node, vc: VCStatus, enable: bool) -> VCStatus:
+    if enable:
+        excludes = await excludes_file()
+        return VCStatus(
+            ignored=await ignored(root, excludes=excludes), status=vc.status
+        )
+    else:
+        return vc
+
+
 def dump_session(state: State) -> None:
     load_path = session_path(state.root.path)
     json = {"index": [*state.index], "show_hidden": state.show_hidden}
@@ -57,16 +68,16 @@ def dump_session(state: State) -> None:
 
 
 async def initial(nvim: Nvim, settings: Settings) -> State:
-    version_ctl = settings.version_ctl
     cwd = await getcwd(nvim)
 
-    session = load_session(cwd)
-    index = session.index if settings.session else {cwd}
+    session = await run_in_executor(load_session, cwd, pool=Workload.persistence)
+    index = {cwd}
     show_hidden = session.show_hidden if settings.session else settings.show_hidden
 
     selection: Selection = set()
-    node, qf = await gather(new(cwd, index=index), quickfix(nvim))
-    vc = VCStatus() if not version_ctl.enable or version_ctl.defer else await status()
+    node = await new(cwd, index=index)
+    qf = QuickFix(locations={})
+    vc = VCStatus()
 
     current = None
     filter_pattern = None
@@ -103,6 +114,7 @@ async def initial(nvim: Nvim, settings: Settings) -> State:
     return state
 
 
+@traced
 async def forward(
     state: State,
     *,
@@ -134,20 +146,61 @@ async def forward(
         ),
     )
     new_qf = or_else(qf, state.qf)
-    new_vc = or_else(vc, state.vc)
+    new_enable_vc = or_else(enable_vc, state.enable_vc)
+    new_vc = (
+        await _vc_ignored(new_root, vc=or_else(vc, state.vc), enable=new_enable_vc)
+        if new_root is not state.root or vc != Void()
+        else state.vc
+    )
     new_hidden = or_else(show_hidden, state.show_hidden)
-    lookup, rendered = render(
-        new_root,
-        settings=settings,
-        index=new_index,
-        selection=new_selection,
-        filter_pattern=new_filter_pattern,
-        qf=new_qf,
-        vc=new_vc,
-        show_hidden=new_hidden,
-        current=new_current,
+    vc_delta = None if new_vc is state.vc else delta(state.vc, new_vc)
+    repaintable = (
+        new_root is state.root
+        and not (vc_delta and vc_delta.ignored)
+        and new_hidden == state.show_hidden
+        and new_filter_pattern == state.filter_pattern
+        and new_current == state.current
+        and new_index == state.index
+        and new_selection == state.selection
+        and new_qf == state.qf
     )
-    paths_lookup = {node.path: idx for idx, node in enumerate(lookup)}
+    if repaintable:
+        lookup, paths_lookup = state.lookup, state.paths_lookup
+        dirty = (
+            {*vc_delta.added, *vc_delta.removed, *vc_delta.changed}
+            if vc_delta
+            else set()
+        )
+        rendered = (
+            repaint(
+                new_root,
+                settings=settings,
+                index=new_index,
+                selection=new_selection,
+                qf=new_qf,
+                vc=new_vc,
+                current=new_current,
+                lookup=lookup,
+                paths_lookup=paths_lookup,
+                rendered=state.rendered,
+                paths=dirty,
+            )
+            if dirty
+            else state.rendered
+        )
+    else:
+        lookup, rendered = render(
+            new_root,
+            settings=settings,
+            index=new_index,
+            selection=new_selection,
+            filter_pattern=new_filter_pattern,
+            qf=new_qf,
+            vc=new_vc,
+            show_hidden=new_hidden,
+            current=new_current,
+        )
+        paths_lookup = {node.path: idx for idx, node in enumerate(lookup)}
 
     new_state = State(
         index=new_index,
@@ -155,7 +208,7 @@ async def forward(
         filter_pattern=new_filter_pattern,
         show_hidden=new_hidden,
         follow=or_else(follow, state.follow),
-        enable_vc=or_else(enable_vc, state.enable_vc),
+        enable_vc=new_enable_vc,
         width=or_else(width, state.width),
         root=new_root,
         qf=new_qf,
@@ -0,0 +1,129 @@
+from asyncio import current_task
+from contextlib import contextmanager
+from functools import wraps
+from inspect import iscoroutinefunction
+from json import dump
+from os import getpid
+from threading import current_thread
+from time import perf_counter_ns
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TypeVar,
+    cast,
+)
+
+T = TypeVar("T", bound=Callable[..., Any])
+
+Event = Dict[str, Any]
+
+_PID = getpid()
+
+_events: Optional[List[Event]] = None
+_tracks: Dict[str, int] = {}
+
+
+def _track() -> int:
+    try:
+        task = current_task()
+    except RuntimeError:
+        task = None
+    thread = current_thread()
+    name = f"{thread.name} task-{id(task):x}" if task else thread.name
+    tid = _tracks.get(name)
+    if tid is None:
+        tid = _tracks[name] = len(_tracks) + 1
+    return tid
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    events = _events
+    if events is None:
+        yield
+    else:
+        tid = _track()
+        begin = perf_counter_ns()
+        args: Dict[str, str] = {}
+        try:
+            yield
+        except BaseException as e:
+            args["raised"] = type(e).__name__
+            raise
+        finally:
+            end = perf_counter_ns()
+            events.append(
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": begin / 1000,
+                    "dur": (end - begin) / 1000,
+                    "pid": _PID,
+                    "tid": tid,
+                    "args": args,
+                }
+            )
+
+
+def traced(fn: T) -> T:
+    _, _, module = fn.__module__.rpartition(".")
+    name = f"{module}.{fn.__qualname__}"
+
+    if iscoroutinefunction(fn):
+
+        @wraps(fn)
+        async def co(*args: Any, **kwargs: Any) -> Any:
+            if _events is None:
+                return await fn(*args, **kwargs)
+            else:
+                with span(name):
+                    return await fn(*args, **kwargs)
+
+        return cast(T, co)
+    else:
+
+        @wraps(fn)
+        def cont(*args: Any, **kwargs: Any) -> Any:
+            if _events is None:
+                return fn(*args, **kwargs)
+            else:
+                with span(name):
+                    return fn(*args, **kwargs)
+
+        return cast(T, cont)
+
+
+def is_tracing() -> bool:
+    return _events is not None
+
+
+def start() -> None:
+    global _events
+    _tracks.clear()
+    _events = []
+
+
+def stop() -> Sequence[Event]:
+    global _events
+    events, _events = _events or [], None
+    metadata = (
+        {
+            "name": "thread_name",
+            "ph": "M",
+            "pid": _PID,
+            "tid": tid,
+            "args": {"name": name},
+        }
+        for name, tid in _tracks.items()
+    )
+    return (*metadata, *events)
+
+
+def dump_trace(path: str, events: Sequence[Event]) -> None:
+    with open(path, "w") as fd:
+        dump({"traceEvents": events, "displayTimeUnit": "ms"}, fd)
@@ -22,7 +22,8 @@ from pynvim import Nvim
 from pynvim.api.buffer import Buffer
 from pynvim.api.window import Window
 
-from .cartographer import new as new_root
+from .cartographer import graft, update
+from .cartographer import prefetch as prefetch_dirs
 from .da import Void, human_readable_size, run_in_executor
 from .fs import (
     ancestors,
@@ -41,10 +42,11 @@ from .nvim import call, getcwd, print
 from .opts import ArgparseError, parse_args
 from .quickfix import quickfix
 from .search import search
-from .state import dump_session, forward
+from .state import dump_session, forward, load_session
 from .state import index as state_index
 from .state import is_dir
 from .system import SystemIntegrationError, open_gui, trash
+from .tracing import traced
 from .types import (
     ClickType,
     FilterPattern,
@@ -56,14 +58,18 @@ from .types import (
     Stage,
     State,
     VCStatus,
+    Workload,
 )
 from .wm import (
     find_current_buffer_name,
+    find_fm_windows_in_tab,
     is_fm_buffer,
     kill_buffers,
     kill_fm_windows,
+    mirrored,
     resize_fm_windows,
     show_file,
+    snapshot,
     toggle_fm_window,
     update_buffers,
 )
@@ -115,11 +121,12 @@ async def _indices(nvim: Nvim, state: State, is_visual: bool) -> Sequence[Node]:
     return await call(nvim, cont)
 
 
-async def redraw(nvim: Nvim, state: State, focus: Optional[str]) -> None:
-    def cont() -> None:
-        update_buffers(nvim, state=state, focus=focus)
+@traced
+async def redraw(nvim: Nvim, state: State, focus: Optional[str]) -> bool:
+    def cont() -> bool:
+        return update_buffers(nvim, state=state, focus=focus)
 
-    await call(nvim, cont)
+    return await call(nvim, cont)
 
 
 def _display_path(path: str, state: State) -> str:
@@ -149,7 +156,7 @@ async def _change_dir(
     nvim: Nvim, state: State, settings: Settings, new_base: str
 ) -> Stage:
     index = state.index | {new_base}
-    root = await new_root(new_base, index=index)
+    root = await graft(state.root, root=new_base, index=index)
     new_state = await forward(state, settings=settings, root=root, index=index)
     return Stage(new_state)
 
@@ -159,6 +166,35 @@ async def a_changedir(nvim: Nvim, state: State, settings: Settings) -> Stage:
     return await _change_dir(nvim, state=state, settings=settings, new_base=cwd)
 
 
+@traced
+async def prefetch(nvim: Nvim, state: State, settings: Settings) -> None:
+    def cont() -> Optional[int]:
+        with mirrored():
+            for window in find_fm_windows_in_tab(snapshot(nvim)):
+                row, _ = nvim.api.win_get_cursor(window)
+                return row - 1
+            return None
+
+    row = await call(nvim, cont)
+    rows = settings.prefetch.rows
+    near = (
+        (state_index(state, r) for r in range(row - rows, row + rows + 1))
+        if row is not None
+        else ()
+    )
+    collapsed = {
+        node.path
+        for node in near
+        if node and Mode.folder in node.mode and node.path not in state.index
+    }
+    current = {
+        path
+        for path in (ancestors(state.current) if state.current else ())
+        if path not in state.index and is_parent(parent=state.root.path, child=path)
+    }
+    await prefetch_dirs(collapsed | current)
+
+
 async def a_follow(nvim: Nvim, state: State, settings: Settings) -> Optional[Stage]:
     def cont() -> str:
         name = find_current_buffer_name(nvim)
@@ -172,7 +208,7 @@ async def a_follow(nvim: Nvim, state: State, settings: Settings) -> Optional[Sta
 
 
 async def a_session(nvim: Nvim, state: State, settings: Settings) -> None:
-    dump_session(state)
+    await run_in_executor(dump_session, state, pool=Workload.persistence)
 
 
 async def a_quickfix(nvim: Nvim, state: State, settings: Settings) -> Stage:
@@ -337,9 +373,9 @@ async def c_collapse(nvim: Nvim, state: State, settings: Settings) -> Optional[S
         return None
 
 
-async def _vc_stat(enable: bool) -> VCStatus:
+async def _vc_stat(root: Node, enable: bool, settings: Settings) -> VCStatus:
     if enable:
-        return await status()
+        return await status(root, timeout=settings.version_ctl.timeout)
     else:
         return VCStatus()
 
@@ -370,7 +406,9 @@ async def c_refresh(
     current_paths: Set[str] = {*ancestors(current)} if state.follow else set()
     new_index = index if new_current else index | current_paths
 
-    qf, vc = await gather(quickfix(nvim), _vc_stat(state.enable_vc))
+    qf, vc = await gather(
+        quickfix(nvim), _vc_stat(state.root, enable=state.enable_vc, settings=settings)
+    )
     new_state = await forward(
         state,
         settings=settings,
@@ -388,6 +426,33 @@ async def c_refresh(
     return Stage(new_state)
 
 
+async def restore(
+    nvim: Nvim, state: State, settings: Settings, cwd: str
+) -> Optional[Stage]:
+    if not settings.session or state.root.path != cwd:
+        return None
+    else:
+        session = await run_in_executor(load_session, cwd, pool=Workload.persistence)
+        index = state.index | {
+            path for path in session.index if is_parent(parent=cwd, child=path)
+        }
+        if index == state.index:
+            return None
+        else:
+            root = await update(state.root, index=index, paths={cwd})
+            new_state = await forward(state, settings=settings, root=root, index=index)
+            return Stage(new_state)
+
+
+async def decorate(nvim: Nvim, state: State, settings: Settings) -> Stage:
+    enable_vc = state.enable_vc and not settings.version_ctl.defer
+    qf, vc = await gather(
+        quickfix(nvim), _vc_stat(state.root, enable=enable_vc, settings=settings)
+    )
+    new_state = await forward(state, settings=settings, qf=qf, vc=vc)
+    return Stage(new_state)
+
+
 async def c_jump_to_current(
     nvim: Nvim, state: State, settings: Settings
 ) -> Optional[Stage]:
@@ -417,7 +482,7 @@ async def c_toggle_follow(nvim: Nvim, state: State, settings: Settings) -> Stage
 
 async def c_toggle_vc(nvim: Nvim, state: State, settings: Settings) -> Stage:
     enable_vc = not state.enable_vc
-    vc = await _vc_stat(enable_vc)
+    vc = await _vc_stat(state.root, enable=enable_vc, settings=settings)
     new_state = await forward(state, settings=settings, enable_vc=enable_vc, vc=vc)
     await print(nvim, f"🐶 enable version control: {new_state.enable_vc}")
     return Stage(new_state)
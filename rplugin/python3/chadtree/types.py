@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 from enum import Enum, IntEnum, auto
-from typing import Dict, Optional, Sequence, Set
+from typing import Dict, Mapping, Optional, Sequence, Set
 
 Index = Set[str]
 Selection = Set[str]
@@ -92,12 +92,35 @@ class ViewOptions:
 class UpdateTime:
     min_time: float
     max_time: float
+    idle_time: float
+    duty_cycle: float
+    frame_time: float
 
 
 @dataclass(frozen=True)
 class VersionControlOptions:
     defer: bool
     enable: bool
+    timeout: float
+
+
+class Workload(Enum):
+    scan = auto()
+    metadata = auto()
+    bulk = auto()
+    persistence = auto()
+
+
+@dataclass(frozen=True)
+class ExecutorOptions:
+    workers: int
+    queue: int
+
+
+@dataclass(frozen=True)
+class PrefetchOptions:
+    enable: bool
+    rows: int
 
 
 @dataclass(frozen=True)
@@ -108,7 +131,6 @@ class MimetypeOptions:
 
 @dataclass(frozen=True)
 class HLcontext:
-    groups: Sequence[HLgroup]
     mode_lookup_pre: Dict[Mode, HLgroup]
     mode_lookup_post: Dict[Optional[Mode], HLgroup]
     ext_lookup: Dict[str, HLgroup]
@@ -123,6 +145,8 @@ class Sortby(Enum):
 
 @dataclass(frozen=True)
 class Settings:
+    cache_nodes: int
+    executors: Dict[Workload, ExecutorOptions]
     follow: bool
     hl_context: HLcontext
     icons: ViewOptions
@@ -132,6 +156,7 @@ class Settings:
     name_ignore: Sequence[str]
     open_left: bool
     path_ignore: Sequence[str]
+    prefetch: PrefetchOptions
     session: bool
     show_hidden: bool
     sort_by: Sequence[Sortby]
@@ -144,7 +169,7 @@ class Settings:
 
 @dataclass(frozen=True)
 class QuickFix:
-    locations: Dict[str, int]
+    locations: Mapping[str, int]
 
 
 @dataclass(frozen=True)
@@ -153,11 +178,19 @@ class VCStatus:
     status: Dict[str, str] = field(default_factory=dict)
 
 
+@dataclass(frozen=True)
+class VCDelta:
+    added: Set[str]
+    removed: Set[str]
+    changed: Set[str]
+    ignored: Set[str]
+
+
 @dataclass(frozen=True)
 class Highlight:
     begin: int
     end: int
-    group: str
+    group: HLgroup
 
 
 @dataclass(frozen=True)
@@ -208,3 +241,9 @@ class ClickType(Enum):
     tertiary = auto()
     v_split = auto()
     h_split = auto()
+
+
+class Priority(IntEnum):
+    user = auto()
+    autocmd = auto()
+    background = auto()
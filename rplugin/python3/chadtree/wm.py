@@ -1,15 +1,32 @@
-from typing import Any, Dict, Iterable, Iterator, Optional, Sequence, Tuple, cast
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 from pynvim import Nvim
 from pynvim.api.buffer import Buffer
-from pynvim.api.tabpage import Tabpage
+from pynvim.api.common import NvimError
 from pynvim.api.window import Window
 
 from .consts import fm_filetype, fm_namespace
 from .fs import is_parent
+from .highlight import commit_hl, define_hl
 from .logging import log
+from .metrics import counter, observe, register
 from .nvim import atomic
-from .types import Badge, ClickType, Highlight, OpenArgs, Settings, State
+from .tracing import traced
+from .types import Badge, ClickType, Highlight, OpenArgs, Render, Settings, State
+
+_frames: Dict[int, Sequence[Render]] = {}
 
 
 class HoldWindowPosition:
@@ -31,62 +48,246 @@ def is_fm_buffer(nvim: Nvim, buffer: Buffer) -> bool:
     return ft == fm_filetype
 
 
-def find_windows_in_tab(nvim: Nvim, exclude: bool) -> Iterator[Window]:
-    def key_by(window: Window) -> Tuple[int, int]:
-        row, col = nvim.api.win_get_position(window)
-        return (col, row)
+@dataclass(frozen=True)
+class BufInfo:
+    number: int
+    name: str
+    filetype: str
+
+
+@dataclass(frozen=True)
+class WinInfo:
+    window: Window
+    buffer: int
+    tab: int
+    row: int
+    col: int
+    preview: bool
+
+
+@dataclass(frozen=True)
+class Topology:
+    tab: int
+    window: Window
+    windows: Sequence[WinInfo]
+    buffers: Mapping[int, BufInfo]
+    names: Mapping[str, int]
+
+
+GEN_VAR = "_chadtree_topology_gen"
+BUF_EVENTS = ("BufAdd", "BufFilePost", "FileType")
+DEL_EVENTS = ("BufDelete", "BufWipeout")
+WIN_EVENTS = ("WinNew", "WinClosed", "WinEnter", "TabEnter", "TabClosed", "BufWinEnter")
+
+_GEN = f"get(g:, '{GEN_VAR}', 0)"
+_BUF = "str2nr(expand('<abuf>'))"
+TOPOLOGY_PRELUDE = f"let g:{GEN_VAR} = {_GEN} + 1"
+
+
+def topology_args(event: str) -> Sequence[str]:
+    return (
+        f"g:{GEN_VAR}",
+        f"'{event}'",
+        _BUF,
+        f"empty(bufname({_BUF})) ? '' : fnamemodify(bufname({_BUF}), ':p')",
+        f"getbufvar({_BUF}, '&filetype')",
+    )
+
+
+_WIN_INFO = (
+    "map(getwininfo(), "
+    "{_, w -> [w.winid, w.bufnr, w.tabnr, w.winrow, w.wincol,"
+    " getwinvar(w.winid, '&previewwindow')]})"
+)
+_BUF_INFO = (
+    "map(getbufinfo(), "
+    "{_, b -> [b.bufnr, b.name, getbufvar(b.bufnr, '&filetype')]})"
+)
+
+
+class Mirror:
+    def __init__(self) -> None:
+        self.gen = -1
+        self.buffers: Dict[int, BufInfo] = {}
+        self.names: Dict[str, int] = {}
+        self.layout: Optional[Tuple[int, Window, Sequence[WinInfo]]] = None
+        self.hits = 0
+        self.rebuilds = 0
+
+    def _drop(self, number: int) -> None:
+        prev = self.buffers.pop(number, None)
+        if prev and self.names.get(prev.name) == number:
+            self.names.pop(prev.name)
+
+    def _put(self, info: BufInfo) -> None:
+        self._drop(info.number)
+        self.buffers[info.number] = info
+        if info.name:
+            self.names[info.name] = info.number
+
+    def apply(self, gen: int, event: str, number: int, name: str, ft: str) -> None:
+        if gen <= self.gen:
+            pass
+        elif gen != self.gen + 1:
+            self.gen = -1
+        else:
+            self.gen = gen
+            if event in DEL_EVENTS:
+                self._drop(number)
+            elif event in BUF_EVENTS:
+                self._put(BufInfo(number=number, name=name, filetype=ft))
+            else:
+                self.layout = None
+
+    def reset(
+        self,
+        gen: int,
+        buffers: Iterable[BufInfo],
+        layout: Tuple[int, Window, Sequence[WinInfo]],
+    ) -> None:
+        self.gen = gen
+        self.buffers.clear()
+        self.names.clear()
+        for info in buffers:
+            self._put(info)
+        self.layout = layout
+        self.rebuilds += 1
+
+    def topology(self) -> Optional[Topology]:
+        if self.gen < 0 or self.layout is None:
+            return None
+        else:
+            tab, window, windows = self.layout
+            self.hits += 1
+            return Topology(
+                tab=tab,
+                window=window,
+                windows=windows,
+                buffers=self.buffers,
+                names=self.names,
+            )
+
+
+_mirror = Mirror()
+
+
+def on_topology_event(gen: int, event: str, number: int, name: str, ft: str) -> None:
+    _mirror.apply(gen, event=event, number=number, name=name, ft=ft)
+
+
+@contextmanager
+def _relayout() -> Iterator[None]:
+    try:
+        yield None
+    finally:
+        _mirror.layout = None
+
+
+@contextmanager
+def mirrored() -> Iterator[None]:
+    try:
+        yield None
+    except NvimError:
+        _mirror.layout = None
+        raise
+
+
+def snapshot(nvim: Nvim) -> Topology:
+    topo = _mirror.topology() if nvim.vars.get(GEN_VAR, 0) == _mirror.gen else None
+    if topo:
+        return topo
+
+    windows, current, tab, gen, win_info, buf_info = atomic(
+        nvim,
+        ("list_wins", ()),
+        ("get_current_win", ()),
+        ("call_function", ("tabpagenr", ())),
+        ("eval", (_GEN,)),
+        ("eval", (_WIN_INFO,)),
+        ("eval", (_BUF_INFO,)),
+    )
+    win_lookup: Dict[int, Window] = {w.handle: w for w in windows}
+    wins = sorted(
+        (
+            WinInfo(
+                window=win_lookup[winid],
+                buffer=bufnr,
+                tab=tabnr,
+                row=row,
+                col=col,
+                preview=bool(preview),
+            )
+            for winid, bufnr, tabnr, row, col, preview in win_info
+            if winid in win_lookup
+        ),
+        key=lambda w: (w.col, w.row),
+    )
+    bufs = (
+        BufInfo(number=number, name=name, filetype=ft) for number, name, ft in buf_info
+    )
+    _mirror.reset(gen, buffers=bufs, layout=(tab, current, wins))
+    return Topology(
+        tab=tab,
+        window=current,
+        windows=wins,
+        buffers=_mirror.buffers,
+        names=_mirror.names,
+    )
+
+
+def mirror_stats() -> Mapping[str, int]:
+    return {"hits": _mirror.hits, "rebuilds": _mirror.rebuilds}
+
+
+register("topology", mirror_stats)
+
+
+def _filetype(topo: Topology, info: WinInfo) -> str:
+    buf = topo.buffers.get(info.buffer)
+    return buf.filetype if buf else ""
 
-    tab: Tabpage = nvim.api.get_current_tabpage()
-    windows: Sequence[Window] = nvim.api.tabpage_list_wins(tab)
 
-    for window in sorted(windows, key=key_by):
-        if not exclude or not nvim.api.win_get_option(window, "previewwindow"):
-            yield window
+def find_windows_in_tab(topo: Topology, exclude: bool) -> Iterator[WinInfo]:
+    for info in topo.windows:
+        if info.tab == topo.tab and not (exclude and info.preview):
+            yield info
 
 
-def find_fm_windows(nvim: Nvim) -> Iterator[Tuple[Window, Buffer]]:
-    for window in nvim.api.list_wins():
-        if window.valid:
-            buffer: Buffer = nvim.api.win_get_buf(window)
-            if is_fm_buffer(nvim, buffer=buffer):
-                yield window, buffer
+def find_fm_windows(topo: Topology) -> Iterator[WinInfo]:
+    for info in topo.windows:
+        if _filetype(topo, info) == fm_filetype:
+            yield info
 
 
-def find_fm_windows_in_tab(nvim: Nvim) -> Iterator[Window]:
-    for window in find_windows_in_tab(nvim, exclude=True):
-        buffer: Buffer = nvim.api.win_get_buf(window)
-        if is_fm_buffer(nvim, buffer=buffer):
-            yield window
+def find_fm_windows_in_tab(topo: Topology) -> Iterator[Window]:
+    for info in find_windows_in_tab(topo, exclude=True):
+        if _filetype(topo, info) == fm_filetype:
+            yield info.window
 
 
-def find_non_fm_windows_in_tab(nvim: Nvim) -> Iterator[Window]:
-    for window in find_windows_in_tab(nvim, exclude=True):
-        buffer: Buffer = nvim.api.win_get_buf(window)
-        if not is_fm_buffer(nvim, buffer=buffer):
-            yield window
+def find_non_fm_windows_in_tab(topo: Topology) -> Iterator[Window]:
+    for info in find_windows_in_tab(topo, exclude=True):
+        if _filetype(topo, info) != fm_filetype:
+            yield info.window
 
 
-def find_window_with_file_in_tab(nvim: Nvim, file: str) -> Iterator[Window]:
-    for window in find_windows_in_tab(nvim, exclude=True):
-        buffer: Buffer = nvim.api.win_get_buf(window)
-        name = nvim.api.buf_get_name(buffer)
-        if name == file:
-            yield window
+def find_window_with_file_in_tab(topo: Topology, file: str) -> Iterator[Window]:
+    number = topo.names.get(file)
+    for info in find_windows_in_tab(topo, exclude=True):
+        if number is not None and info.buffer == number:
+            yield info.window
 
 
-def find_fm_buffers(nvim: Nvim) -> Iterator[Buffer]:
-    buffers: Sequence[Buffer] = nvim.api.list_bufs()
-    for buffer in buffers:
-        if is_fm_buffer(nvim, buffer=buffer):
-            yield buffer
+def find_fm_buffers(topo: Topology) -> Iterator[int]:
+    for info in topo.buffers.values():
+        if info.filetype == fm_filetype:
+            yield info.number
 
 
-def find_buffer_with_file(nvim: Nvim, file: str) -> Iterator[Buffer]:
-    buffers: Sequence[Buffer] = nvim.api.list_bufs()
-    for buffer in buffers:
-        name = nvim.api.buf_get_name(buffer)
-        if name == file:
-            yield buffer
+def find_buffer_with_file(topo: Topology, file: str) -> Iterator[int]:
+    number = topo.names.get(file)
+    if number is not None:
+        yield number
 
 
 def find_current_buffer_name(nvim: Nvim) -> str:
@@ -112,69 +313,83 @@ def new_fm_buffer(nvim: Nvim, keymap: Dict[str, Sequence[str]]) -> Buffer:
     return buffer
 
 
-def new_window(nvim: Nvim, *, open_left: bool, width: int) -> Window:
+def new_window(nvim: Nvim, *, topo: Topology, open_left: bool, width: int) -> Window:
     split_r = nvim.api.get_option("splitright")
 
-    windows: Sequence[Window] = tuple(
-        w for w in find_windows_in_tab(nvim, exclude=False)
-    )
+    windows = tuple(info.window for info in find_windows_in_tab(topo, exclude=False))
     focus_win = windows[0] if open_left else windows[-1]
     direction = False if open_left else True
 
     nvim.api.set_option("splitright", direction)
     nvim.api.set_current_win(focus_win)
-    nvim.command(f"{width}vsplit")
+    with _relayout():
+        nvim.command(f"{width}vsplit")
     nvim.api.set_option("splitright", split_r)
 
     window: Window = nvim.api.get_current_win()
     return window
 
 
+@mirrored()
 def resize_fm_windows(nvim: Nvim, width: int) -> None:
     log.debug("%s", "window resized", stack_info=True)
-    for window in find_fm_windows_in_tab(nvim):
-        nvim.api.win_set_width(window, width)
+    topo = snapshot(nvim)
+    instructions = (
+        ("win_set_width", (window, width)) for window in find_fm_windows_in_tab(topo)
+    )
+    atomic(nvim, *instructions)
 
 
+@mirrored()
 def kill_fm_windows(nvim: Nvim, *, settings: Settings) -> None:
-    windows: Sequence[Window] = nvim.api.list_wins()
-    if len(windows) <= 1:
-        nvim.api.command("quit")
-    else:
-        for window in find_fm_windows_in_tab(nvim):
-            nvim.api.win_close(window, True)
+    topo = snapshot(nvim)
+    with _relayout():
+        if len(topo.windows) <= 1:
+            nvim.api.command("quit")
+        else:
+            instructions = (
+                ("win_close", (window, True))
+                for window in find_fm_windows_in_tab(topo)
+            )
+            atomic(nvim, *instructions)
 
 
+@mirrored()
 def ensure_side_window(
     nvim: Nvim, *, window: Window, state: State, settings: Settings
 ) -> None:
     open_left = settings.open_left
-    windows = tuple(find_windows_in_tab(nvim, exclude=False))
+    windows = tuple(find_windows_in_tab(snapshot(nvim), exclude=False))
     target = windows[0] if open_left else windows[-1]
-    if window.number != target.number:
-        if open_left:
-            nvim.api.command("wincmd H")
-        else:
-            nvim.api.command("wincmd L")
+    if window.handle != target.window.handle:
+        with _relayout():
+            if open_left:
+                nvim.api.command("wincmd H")
+            else:
+                nvim.api.command("wincmd L")
         resize_fm_windows(nvim, state.width)
 
 
+@mirrored()
 def toggle_fm_window(
     nvim: Nvim, *, state: State, settings: Settings, opts: OpenArgs
 ) -> None:
-    cwin: Window = nvim.api.get_current_win()
-    window: Optional[Window] = next(find_fm_windows_in_tab(nvim), None)
+    topo = snapshot(nvim)
+    cwin = topo.window
+    window: Optional[Window] = next(find_fm_windows_in_tab(topo), None)
     if window:
-        windows: Sequence[Window] = nvim.api.list_wins()
-        if len(windows) <= 1:
+        if len(topo.windows) <= 1:
             pass
         else:
-            nvim.api.win_close(window, True)
+            with _relayout():
+                nvim.api.win_close(window, True)
     else:
-        buffer: Buffer = next(find_fm_buffers(nvim), None)
+        buffer: Union[int, Buffer, None] = next(find_fm_buffers(topo), None)
         if buffer is None:
             buffer = new_fm_buffer(nvim, keymap=settings.keymap)
-        window = new_window(nvim, open_left=settings.open_left, width=state.width)
+        window = new_window(
+            nvim, topo=topo, open_left=settings.open_left, width=state.width
+        )
         nvim.api.win_set_buf(window, buffer)
         for option in settings.win_local_opts:
             nvim.api.command(f"setlocal {option}")
@@ -183,31 +398,33 @@ def toggle_fm_window(
             nvim.api.set_current_win(cwin)
 
 
+@mirrored()
 def show_file(
     nvim: Nvim, *, state: State, settings: Settings, click_type: ClickType
 ) -> None:
     path = state.current
     hold = click_type == ClickType.secondary
     if click_type == ClickType.tertiary:
-        nvim.api.command("tabnew")
+        with _relayout():
+            nvim.api.command("tabnew")
     if path:
         with HoldWindowPosition(nvim, hold=hold):
-            non_fm_windows = tuple(find_non_fm_windows_in_tab(nvim))
-            buffer: Optional[Buffer] = next(
-                find_buffer_with_file(nvim, file=path), None
-            )
+            topo = snapshot(nvim)
+            non_fm_windows = tuple(find_non_fm_windows_in_tab(topo))
+            buffer: Optional[int] = next(find_buffer_with_file(topo, file=path), None)
             window: Window = next(
-                find_window_with_file_in_tab(nvim, file=path), None
+                find_window_with_file_in_tab(topo, file=path), None
             ) or next(iter(non_fm_windows), None) or new_window(
-                nvim, open_left=not settings.open_left, width=state.width
+                nvim, topo=topo, open_left=not settings.open_left, width=state.width
             )
 
             nvim.api.set_current_win(window)
             non_fm_count = len(non_fm_windows)
-            if click_type == ClickType.v_split and non_fm_count:
-                nvim.api.command("vsplit")
-            elif click_type == ClickType.h_split and non_fm_count:
-                nvim.api.command("split")
+            with _relayout():
+                if click_type == ClickType.v_split and non_fm_count:
+                    nvim.api.command("vsplit")
+                elif click_type == ClickType.h_split and non_fm_count:
+                    nvim.api.command("split")
             window = nvim.api.get_current_win()
 
             if buffer is None:
@@ -218,16 +435,17 @@ def show_file(
             nvim.api.command("filetype detect")
 
 
+@mirrored()
 def kill_buffers(nvim: Nvim, paths: Iterable[str]) -> None:
-    buffers: Sequence[Buffer] = nvim.api.list_bufs()
-    for buffer in buffers:
-        name = nvim.api.buf_get_name(buffer)
+    topo = snapshot(nvim)
+    for name, number in tuple(topo.names.items()):
         if any(name == path or is_parent(parent=path, child=name) for path in paths):
-            nvim.command(f"bwipeout! {buffer.number}")
+            with _relayout():
+                nvim.command(f"bwipeout! {number}")
 
 
 def buf_setlines(
-    nvim: Nvim, buffer: Buffer, lines: Sequence[str]
+    nvim: Nvim, buffer: int, lines: Sequence[str]
 ) -> Iterator[Tuple[str, Sequence[Any]]]:
     yield "buf_set_option", (buffer, "modifiable", True)
     yield "buf_set_lines", (buffer, 0, -1, True, lines)
@@ -235,66 +453,133 @@ def buf_setlines(
 
 
 def buf_set_virtualtext(
-    nvim: Nvim, buffer: Buffer, ns: int, vtext: Sequence[Sequence[Badge]]
+    nvim: Nvim, buffer: int, ns: int, vtext: Iterable[Tuple[int, Sequence[Badge]]]
 ) -> Iterator[Tuple[str, Sequence[Any]]]:
-    for idx, badges in enumerate(vtext):
+    for idx, badges in vtext:
         vtxt = tuple((badge.text, badge.group) for badge in badges)
-        yield "buf_set_virtual_text", (
-            buffer,
-            ns,
-            idx,
-            vtxt,
-            {},
-        )
+        if vtxt:
+            yield "buf_set_virtual_text", (
+                buffer,
+                ns,
+                idx,
+                vtxt,
+                {},
+            )
 
 
 def buf_set_highlights(
-    nvim: Nvim, buffer: Buffer, ns: int, highlights: Sequence[Sequence[Highlight]]
+    nvim: Nvim,
+    buffer: int,
+    ns: int,
+    highlights: Iterable[Tuple[int, Sequence[Highlight]]],
 ) -> Iterator[Tuple[str, Sequence[Any]]]:
-    for idx, hl in enumerate(highlights):
+    for idx, hl in highlights:
         for h in hl:
-            yield "buf_add_highlight", (buffer, ns, h.group, idx, h.begin, h.end)
+            yield from define_hl((h.group,))
+            yield "buf_add_highlight", (buffer, ns, h.group.name, idx, h.begin, h.end)
 
 
-def update_buffers(nvim: Nvim, state: State, focus: Optional[str]) -> None:
+def buf_redraw(
+    nvim: Nvim, buffer: int, ns: int, rendered: Sequence[Render]
+) -> Iterator[Tuple[str, Sequence[Any]]]:
+    lines = tuple(render.line for render in rendered)
+    yield "buf_clear_namespace", (buffer, ns, 0, -1)
+    yield from buf_setlines(nvim, buffer=buffer, lines=lines)
+    yield from buf_set_virtualtext(
+        nvim,
+        buffer=buffer,
+        ns=ns,
+        vtext=((idx, render.badges) for idx, render in enumerate(rendered)),
+    )
+    yield from buf_set_highlights(
+        nvim,
+        buffer=buffer,
+        ns=ns,
+        highlights=((idx, render.highlights) for idx, render in enumerate(rendered)),
+    )
+
+
+def buf_repaint(
+    nvim: Nvim,
+    buffer: int,
+    ns: int,
+    prev: Sequence[Render],
+    rendered: Sequence[Render],
+    rows: Sequence[int],
+) -> Iterator[Tuple[str, Sequence[Any]]]:
+    lines = tuple(row for row in rows if prev[row].line != rendered[row].line)
+    if lines:
+        yield "buf_set_option", (buffer, "modifiable", True)
+        for row in lines:
+            yield "buf_set_lines", (buffer, row, row + 1, True, (rendered[row].line,))
+        yield "buf_set_option", (buffer, "modifiable", False)
+    for row in rows:
+        yield "buf_clear_namespace", (buffer, ns, row, row + 1)
+    yield from buf_set_virtualtext(
+        nvim, buffer=buffer, ns=ns, vtext=((row, rendered[row].badges) for row in rows)
+    )
+    yield from buf_set_highlights(
+        nvim,
+        buffer=buffer,
+        ns=ns,
+        highlights=((row, rendered[row].highlights) for row in rows),
+    )
+
+
+@traced
+@mirrored()
+def update_buffers(nvim: Nvim, state: State, focus: Optional[str]) -> bool:
+    calls = counter("rpc.calls")
     focus_row = state.paths_lookup.get(focus) if focus else None
     current = state.current
     current_row = state.paths_lookup.get(current or "")
-    lines, badges, highlights = tuple(
-        zip(
-            *(
-                (render.line, render.badges, render.highlights)
-                for render in state.rendered
-            )
-        )
+    rendered = state.rendered
+    topo = snapshot(nvim)
+    cwin = topo.window
+    fm_windows = tuple(find_fm_windows(topo))
+    ns, *cursors = atomic(
+        nvim,
+        ("create_namespace", (fm_namespace,)),
+        *(("win_get_cursor", (info.window,)) for info in fm_windows),
     )
-    cwin = nvim.api.get_current_win()
-    ns = nvim.api.create_namespace(fm_namespace)
 
-    for window, buffer in find_fm_windows(nvim):
-        row, col = nvim.api.win_get_cursor(window)
-        lines = cast(Sequence[str], lines)
+    for info, (row, col) in zip(fm_windows, cursors):
+        window, buffer = info.window, info.buffer
         new_row = (
             focus_row + 1
             if focus_row is not None
             else (
                 current_row + 1
-                if window.number != cwin.number and current_row is not None
-                else min(row, len(lines))
+                if window.handle != cwin.handle and current_row is not None
+                else min(row, len(rendered))
             )
         )
-        it1 = "buf_clear_namespace", (buffer, ns, 0, -1)
-        it2 = buf_setlines(nvim, buffer=buffer, lines=lines)
-        it3 = buf_set_virtualtext(
-            nvim, buffer=buffer, ns=ns, vtext=cast(Sequence[Sequence[Badge]], badges),
-        )
-        it4 = buf_set_highlights(
-            nvim,
-            buffer=buffer,
-            ns=ns,
-            highlights=cast(Sequence[Sequence[Highlight]], highlights),
-        )
-        it5 = "win_set_cursor", (window, (new_row, col))
-        atomic(
-            nvim, it1, *it2, *it3, *it4, it5,
-        )
+        prev = _frames.get(buffer)
+        if prev is not None and len(prev) == len(rendered):
+            rows: Sequence[int] = tuple(
+                idx
+                for idx, (p, r) in enumerate(zip(prev, rendered))
+                if p is not r and p != r
+            )
+            instructions = buf_repaint(
+                nvim, buffer=buffer, ns=ns, prev=prev, rendered=rendered, rows=rows
+            )
+        else:
+            rows = range(len(rendered))
+            instructions = buf_redraw(nvim, buffer=buffer, ns=ns, rendered=rendered)
+        cursor = "win_set_cursor", (window, (new_row, col))
+        payload = (*instructions, cursor)
+        try:
+            atomic(nvim, *payload)
+        except NvimError:
+            commit_hl(False)
+            raise
+        else:
+            commit_hl(True)
+        _frames[buffer] = rendered
+        observe("redraw.rows", len(rows))
+        observe("redraw.instructions", len(payload))
+        observe("redraw.line_bytes", sum(len(rendered[r].line.encode()) for r in rows))
+
+    observe("redraw.rpc_calls", counter("rpc.calls") - calls)
+    return bool(fm_windows)